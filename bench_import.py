@@ -0,0 +1,70 @@
+"""
+Measures the import time of the helpers, each scenario in a fresh interpreter.
+
+Usage:
+    python bench_import.py [--repeat 5] [--importtime]
+
+--importtime prints the 15 slowest modules of each scenario (python -X importtime).
+"""
+
+import sys
+import argparse
+import statistics
+import subprocess
+
+
+SCENARIOS = {
+    'python startup': 'pass',
+    'package only': 'import dck_helpers',
+    'duckdb-only job': 'from dck_helpers import DuckDBConnector, RunJournal, run_duckdb_queries, '
+                       'generate_report',
+    'job runner': 'import run_job',
+    'all helpers': 'import dck_helpers as h; [getattr(h, n) for n in h.__all__]',
+    'oracle and gdb loads': 'from dck_helpers import oracle_2_duckdb, gdf_to_duckdb; '
+                            'import cx_Oracle, geopandas, pyogrio',
+}
+
+
+def time_import(stmt):
+    """Returns the time (s) to run stmt in a fresh interpreter, None if it fails"""
+    code = ('import time; t = time.perf_counter(); '
+            f'{stmt}; '
+            'print(time.perf_counter() - t)')
+    proc = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True)
+    if proc.returncode != 0:
+        return None
+
+    return float(proc.stdout.strip().splitlines()[-1])
+
+
+def slowest_modules(stmt, top=15):
+    """Returns the slowest modules (cumulative us, name) imported by stmt"""
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', stmt],
+                          capture_output=True, text=True)
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        rows.append((int(cumulative), name.strip()))
+
+    return sorted(rows, reverse=True)[:top]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the import time of the helpers')
+    parser.add_argument('--repeat', type=int, default=5, help='runs per scenario')
+    parser.add_argument('--importtime', action='store_true', help='show the slowest modules')
+    args = parser.parse_args()
+
+    print(f"{'scenario':<24}{'min (ms)':>10}{'median (ms)':>13}")
+    for name, stmt in SCENARIOS.items():
+        times = [time_import(stmt) for _ in range(args.repeat)]
+        if None in times:
+            print(f'{name:<24}{"failed (missing dependency?)":>23}')
+            continue
+        print(f'{name:<24}{min(times) * 1000:>10.1f}{statistics.median(times) * 1000:>13.1f}')
+
+        if args.importtime:
+            for cumulative, module in slowest_modules(stmt):
+                print(f'    {cumulative / 1000:>8.1f} ms  {module}')
@@ -0,0 +1,111 @@
+"""
+Helpers to load Oracle, GDB and shapefile layers into duckdb and run spatial analyses.
+
+Importing the package is cheap: each helper is imported from its submodule
+on first use (e.g. `from dck_helpers import run_duckdb_queries` only loads
+dck_helpers.queries), and the heavy dependencies (cx_Oracle, geopandas, shapely,
+pyogrio, pandas, pyarrow) are only imported by the functions that need them.
+A duckdb-only job never loads the Oracle client or GEOS.
+
+Submodules:
+    connectors      Oracle and duckdb connections
+    readers         Oracle query results and ESRI vectors (shp, featureclass/gdb)
+    extract         parameterized Oracle extracts (typed and list binds, streamed results)
+    catalog         table existence, layer CRS and RTREE indexes
+    aoi             area of interest accepted by the loaders
+    reference       shared read-only reference database
+    loaders         Oracle, GDB and shapefile loaders
+    queries         duckdb queries and result shaping
+    report          excel reports
+    geometry_store  compact columnar (NumPy) store of query result geometries
+    memory          memory budget: duckdb memory limit, spilling and batch sizes
+    events          structured progress events of the loaders (JSON lines, Prometheus)
+    journal         run journal of the completed steps
+    tiled_join      grid-tiled spatial join across processes
+"""
+
+import importlib
+
+_exports = {
+    'OracleConnector': 'connectors',
+    'DuckDBConnector': 'connectors',
+    'read_query': 'readers',
+    'esri_to_gdf': 'readers',
+    'split_esri_path': 'readers',
+    'esri_crs': 'readers',
+    'esri_to_arrow': 'readers',
+    'get_wkb_srid': 'readers',
+    'iter_query': 'readers',
+    'oracle_dtypes': 'readers',
+    'unconstrained_numbers': 'readers',
+    'iter_esri_arrow': 'readers',
+    'plain_geometry': 'readers',
+    'OracleExtract': 'extract',
+    'expand_binds': 'extract',
+    'bind_names': 'extract',
+    'geometry_rows_sql': 'extract',
+    'table_exists': 'catalog',
+    'layer_kind': 'catalog',
+    'drop_layer': 'catalog',
+    'geometry_expr': 'catalog',
+    'same_crs': 'catalog',
+    'create_layer_crs': 'catalog',
+    'record_layer_crs': 'catalog',
+    'get_layer_crs': 'catalog',
+    'check_same_crs': 'catalog',
+    'create_rtree_index': 'catalog',
+    'AOI': 'aoi',
+    'filter_table': 'aoi',
+    'attach_reference_db': 'reference',
+    'use_reference_layer': 'reference',
+    'build_reference_db': 'reference',
+    'load_df_to_duckdb': 'loaders',
+    'load_batches_to_duckdb': 'loaders',
+    'simplify_table': 'loaders',
+    'oracle_2_duckdb': 'loaders',
+    'gdf_to_duckdb': 'loaders',
+    'esri_2_duckdb': 'loaders',
+    'shape_query': 'queries',
+    'run_duckdb_queries': 'queries',
+    'generate_report': 'report',
+    'GeometryStore': 'geometry_store',
+    'MemoryBudget': 'memory',
+    'parse_size': 'memory',
+    'row_width': 'memory',
+    'LoadProgress': 'events',
+    'print_event': 'events',
+    'fan_out': 'events',
+    'JsonLinesEmitter': 'events',
+    'PrometheusEmitter': 'events',
+    'RunJournal': 'journal',
+    'fingerprint_sql': 'journal',
+    'fingerprint_source': 'journal',
+    'tiled_spatial_join': 'tiled_join',
+    'run_tiled_query': 'tiled_join',
+    'join_sql': 'tiled_join',
+}
+
+_submodules = {'connectors', 'readers', 'extract', 'catalog', 'aoi', 'reference', 'loaders',
+               'queries', 'report', 'geometry_store', 'memory', 'events', 'journal', 'tiled_join'}
+
+__all__ = list(_exports)
+
+
+def __getattr__(name):
+    """Imports a helper (or a submodule) on first access"""
+    if name in _exports:
+        module = importlib.import_module(f'.{_exports[name]}', __name__)
+        value = getattr(module, name)
+    elif name in _submodules:
+        value = importlib.import_module(f'.{name}', __name__)
+    else:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    # cached: next accesses don't go through __getattr__
+    globals()[name] = value
+
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__) | _submodules)
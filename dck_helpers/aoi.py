@@ -0,0 +1,97 @@
+"""Area of interest (AOI) accepted by the loaders"""
+
+import re
+from .catalog import layer_kind, geometry_expr, get_layer_crs, create_rtree_index
+from .readers import esri_to_gdf
+
+
+class AOI:
+    """Area of interest shared by the loaders: a geometry, its CRS 
+       and a buffer distance (in CRS units)"""
+    def __init__(self, geometry, crs, buffer=0):
+        self.geometry = geometry
+        self.crs = crs
+        self.buffer = buffer
+    
+    @classmethod
+    def from_file(cls, path, buffer=0):
+        """Returns an AOI from the union of the features of a shp or featureclass"""
+        import shapely
+        
+        gdf = esri_to_gdf(path)
+        geometry = shapely.union_all(gdf.geometry.values)
+        
+        return cls(geometry, gdf.crs.to_string(), buffer)
+    
+    @property
+    def wkb(self):
+        """2D WKB of the AOI geometry (unbuffered)"""
+        from shapely import wkb
+        
+        return wkb.dumps(self.geometry, output_dimension=2)
+    
+    @property
+    def srid(self):
+        """EPSG code of the AOI CRS (Oracle SRID)"""
+        from pyproj import CRS
+        
+        srid = CRS.from_user_input(self.crs).to_epsg()
+        if srid is None:
+            raise Exception(f'The AOI CRS has no EPSG code: {self.crs}')
+        
+        return srid
+    
+    def mask(self, crs=None):
+        """Returns the buffered AOI geometry, reprojected to crs if provided"""
+        geom = self.geometry.buffer(self.buffer) if self.buffer else self.geometry
+        if crs and crs != self.crs:
+            import geopandas as gpd
+            geom = gpd.GeoSeries([geom], crs=self.crs).to_crs(crs).iloc[0]
+        
+        return geom
+    
+    def bbox(self, crs=None):
+        """Returns the bounds (xmin, ymin, xmax, ymax) of the buffered AOI, in crs if provided"""
+        return tuple(self.mask(crs).bounds)
+    
+    def bind_vars(self):
+        """Returns the Oracle bind variables of the AOI (:wkb_aoi, :srid)"""
+        return {'wkb_aoi': self.wkb, 'srid': self.srid}
+    
+    def oracle_predicate(self, geom_col):
+        """Returns the Oracle spatial predicate filtering geom_col by the AOI"""
+        if self.buffer:
+            return (f"SDO_WITHIN_DISTANCE({geom_col}, SDO_GEOMETRY(:wkb_aoi, :srid), "
+                    f"'distance={self.buffer} unit=m') = 'TRUE'")
+        
+        return f"SDO_ANYINTERACT({geom_col}, SDO_GEOMETRY(:wkb_aoi, :srid)) = 'TRUE'"
+    
+    def expand_oracle_sql(self, sql):
+        """Replaces the AOI_FILTER(<geometry column>) tokens of an Oracle query
+           by the AOI spatial predicate"""
+        return re.sub(r'AOI_FILTER\(\s*([\w\.]+)\s*\)', 
+                      lambda m: self.oracle_predicate(m.group(1)), sql)
+    
+    def duckdb_filter(self, geom_col='geometry', crs=None):
+        """Returns the duckdb predicate filtering geom_col (in crs) by the AOI.
+           The AOI is a constant geometry, so an RTREE index on geom_col is used"""
+        aoi = f"ST_GeomFromHEXWKB('{self.wkb.hex()}')"
+        if self.buffer:
+            aoi = f'ST_Buffer({aoi}, {self.buffer})'
+        aoi = geometry_expr(aoi, self.crs, crs)
+        
+        return f'ST_Intersects({geom_col}, {aoi})'
+    
+    def fingerprint(self):
+        return {'aoi': self.wkb, 'aoi_crs': self.crs, 'aoi_buffer': self.buffer}
+
+
+def filter_table(dckCnx, table, aoi):
+    """Returns a lazy relation of the features of a duckdb table 
+       within the AOI, using an RTREE index. A view on a reference database
+       can't be indexed (the reference layers are indexed when built)"""
+    if layer_kind(dckCnx, table) == 'TABLE':
+        create_rtree_index(dckCnx, table)
+    
+    return dckCnx.table(table).filter(aoi.duckdb_filter('geometry', 
+                                                        get_layer_crs(dckCnx, table)))
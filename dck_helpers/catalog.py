@@ -0,0 +1,119 @@
+"""Catalog of the duckdb layers: existence, CRS and spatial indexes"""
+
+from .events import LoadProgress
+
+
+def table_exists(dckCnx, table, database=None):
+    """Returns True if the table exists in the duckdb database 
+       (or in an attached database)"""
+    return dckCnx.execute("""SELECT COUNT(*) 
+                             FROM duckdb_tables() 
+                             WHERE table_name = ?
+                                AND database_name = COALESCE(?, current_database())""", 
+                          [table, database]).fetchone()[0] > 0
+
+
+def layer_kind(dckCnx, table):
+    """Returns 'TABLE' or 'VIEW' if a layer of that name exists
+       in the duckdb database (None otherwise)"""
+    row = dckCnx.execute("""SELECT 'TABLE' FROM duckdb_tables()
+                            WHERE table_name = ? AND database_name = current_database()
+                            UNION ALL
+                            SELECT 'VIEW' FROM duckdb_views()
+                            WHERE view_name = ? AND database_name = current_database()
+                                AND NOT internal""",
+                         [table, table]).fetchone()
+
+    return row[0] if row else None
+
+
+def drop_layer(dckCnx, table, kind=None):
+    """Drops a layer (table or view) of the duckdb database, only if it is
+       of the given kind ('TABLE' or 'VIEW'). duckdb fails to DROP VIEW a table
+       (and DROP TABLE a view), even with IF EXISTS"""
+    found = layer_kind(dckCnx, table)
+    if found is not None and kind in (None, found):
+        dckCnx.execute(f'DROP {found} "{table}"')
+
+
+def same_crs(crs_a, crs_b):
+    """Returns True if two CRS (e.g 'EPSG:3005', WKT or PROJ strings) are the same CRS,
+       whatever their spelling. Two unknown (None) CRS are the same"""
+    if not crs_a or not crs_b:
+        return not crs_a and not crs_b
+    if crs_a == crs_b:
+        return True
+    
+    from pyproj import CRS
+    return CRS.from_user_input(crs_a) == CRS.from_user_input(crs_b)
+
+
+def geometry_expr(expr, src_crs=None, target_crs=None):
+    """Returns the SQL expression reprojecting a geometry expression 
+       from src_crs to target_crs (e.g 'EPSG:3005'), if they differ"""
+    if target_crs is None or same_crs(src_crs, target_crs):
+        return expr
+    
+    if not src_crs:
+        raise Exception(f'Cannot reproject to {target_crs}: the source CRS is unknown')
+    
+    return f"ST_Transform({expr}, '{src_crs}', '{target_crs}', true)"
+
+
+def create_layer_crs(dckCnx):
+    """Creates the layer_crs metadata table if it doesn't exist"""
+    dckCnx.execute("""
+        CREATE TABLE IF NOT EXISTS layer_crs (
+            table_name VARCHAR PRIMARY KEY,
+            source_crs VARCHAR,
+            crs VARCHAR,
+            has_z BOOLEAN,
+            z_dropped BOOLEAN,
+            updated_at TIMESTAMP
+        );
+        """)
+
+
+def record_layer_crs(dckCnx, table, src_crs, target_crs=None, force_2d=True, progress=None):
+    """Records the CRS of a duckdb table in the layer_crs metadata table.
+       Z coordinates are dropped if force_2d, and the drop is recorded
+       (and sent to progress)"""
+    progress = progress or LoadProgress(table=table)
+    create_layer_crs(dckCnx)
+    
+    has_z = dckCnx.execute(f"""SELECT COALESCE(bool_or(ST_HasZ(geometry)), false) 
+                               FROM {table}""").fetchone()[0]
+    if has_z and force_2d:
+        progress.event('force_2d', '....dropping Z coordinates')
+        dckCnx.execute(f'UPDATE {table} SET geometry = ST_Force2D(geometry)')
+    
+    dckCnx.execute("""INSERT OR REPLACE INTO layer_crs 
+                      VALUES (?, ?, ?, ?, ?, now()::TIMESTAMP)""",
+                   [table, src_crs, target_crs or src_crs, has_z, has_z and force_2d])
+
+
+def get_layer_crs(dckCnx, table, database=None):
+    """Returns the CRS recorded for a duckdb table (None if unknown)"""
+    if not table_exists(dckCnx, 'layer_crs', database):
+        return None
+    
+    layer_crs = f'{database}.layer_crs' if database else 'layer_crs'
+    row = dckCnx.execute(f"SELECT crs FROM {layer_crs} WHERE table_name = ?", 
+                         [table]).fetchone()
+    
+    return row[0] if row else None
+
+
+def check_same_crs(dckCnx, tables):
+    """Raises an exception if the tables were recorded in different CRS"""
+    crs_list = {t: get_layer_crs(dckCnx, t) for t in tables}
+    known = [c for c in crs_list.values() if c]
+    
+    if any(not same_crs(known[0], c) for c in known[1:]):
+        raise Exception(f'Tables in different CRS: {crs_list}')
+
+
+def create_rtree_index(dckCnx, table):
+    """Creates an RTREE index on the geometry column of a table, if missing"""
+    dckCnx.execute(f"""CREATE INDEX IF NOT EXISTS idx_geo_{table}
+                         ON {table} USING RTREE (geometry);""")
@@ -0,0 +1,66 @@
+"""Oracle and duckdb connections"""
+
+import json
+import duckdb
+
+
+class OracleConnector:
+    def __init__(self, dbname='BCGW'):
+        self.dbname = dbname
+        self.cnxinfo = self.get_db_cnxinfo()
+
+    def get_db_cnxinfo(self):
+        """ Retrieves db connection params from the config file"""
+        with open(r'H:\config\db_config.json', 'r') as file:
+            data = json.load(file)
+        
+        if self.dbname in data:
+            return data[self.dbname]
+        
+        raise KeyError(f"Database '{self.dbname}' not found.")
+    
+    def connect_to_db(self):
+        """ Connects to Oracle DB and create a cursor"""
+        import cx_Oracle
+        
+        try:
+            self.connection = cx_Oracle.connect(self.cnxinfo['username'], 
+                                                self.cnxinfo['password'], 
+                                                self.cnxinfo['hostname'], 
+                                                encoding="UTF-8")
+            self.cursor = self.connection.cursor()
+            print  ("..Successffuly connected to the database")
+        except Exception as e:
+            raise Exception(f'..Connection failed: {e}')
+
+    def disconnect_db(self):
+        """Close the Oracle connection and cursor"""
+        if hasattr(self, 'cursor') and self.cursor:
+            self.cursor.close()
+        if hasattr(self, 'connection') and self.connection:
+            self.connection.close()
+            print("....Disconnected from the database")
+
+
+class DuckDBConnector:
+    def __init__(self, db=':memory:', budget=None, emit=None):
+        self.db = db
+        self.budget = budget
+        self.emit = emit
+        self.conn = None
+    
+    def connect_to_db(self):
+        """Connects to a DuckDB database and installs spatial extension.
+           With a memory budget, duckdb memory is limited and spills to disk."""
+        self.conn = duckdb.connect(self.db)
+        self.conn.install_extension('spatial')
+        self.conn.load_extension('spatial')
+        if self.budget is not None:
+            self.budget.configure(self.conn, self.emit)
+        return self.conn
+    
+    def disconnect_db(self):
+        """Disconnects from the DuckDB database."""
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
@@ -0,0 +1,180 @@
+"""
+Structured progress events of the loaders, and their emitters.
+
+An emitter is any callable taking an event (dict):
+    ts          time of the event (epoch seconds)
+    source      oracle, gdb or esri
+    table       duckdb table being loaded
+    phase       start, skip, extract, batch_size, batch, ingest, force_2d, simplify,
+                drop, index, done or failed (budget: memory budget of the run)
+    index/total position of the table in the load
+    rows        rows loaded so far
+    bytes       in-memory size of the data loaded so far (None if not measured)
+    elapsed_s   seconds since the start of the table
+    phase_s     seconds since the previous event of the table
+    rows_per_s  throughput so far
+    message     human readable progress, printed by the default emitter
+plus the fields of the phase (e.g the area and vertex counts before/after of simplify).
+
+print_event (default) prints the messages, JsonLinesEmitter writes the events
+as JSON lines and PrometheusEmitter keeps a Prometheus textfile of the last loads.
+Combine them with fan_out.
+"""
+
+import os
+import json
+import time
+import threading
+
+
+def print_event(event):
+    """Default emitter: prints the progress message of the event, if any"""
+    if event.get('message'):
+        print(event['message'])
+
+
+def fan_out(*emitters):
+    """Returns an emitter sending the events to several emitters"""
+    emitters = [e for e in emitters if e is not None]
+
+    def emit(event):
+        for e in emitters:
+            e(event)
+
+    return emit
+
+
+class JsonLinesEmitter:
+    """Appends the events to a file (or writes them to a stream) as JSON lines"""
+    def __init__(self, path_or_stream):
+        self.lock = threading.Lock()
+        if isinstance(path_or_stream, str):
+            self.stream = open(path_or_stream, 'a', encoding='utf-8')
+            self.owned = True
+        else:
+            self.stream = path_or_stream
+            self.owned = False
+
+    def __call__(self, event):
+        line = json.dumps(event, default=str)
+        with self.lock:
+            self.stream.write(line + '\n')
+            self.stream.flush()
+
+    def close(self):
+        if self.owned:
+            self.stream.close()
+
+
+class PrometheusEmitter:
+    """Keeps a Prometheus textfile (node_exporter textfile collector) with the
+       metrics of the last load of each table. The file is rewritten atomically
+       when a table is done, skipped or failed"""
+    metrics = {
+        'rows': ('gauge', 'Rows loaded by the last load of the table'),
+        'bytes': ('gauge', 'In-memory size of the data of the last load of the table'),
+        'duration_seconds': ('gauge', 'Duration of the last load of the table'),
+        'rows_per_second': ('gauge', 'Throughput of the last load of the table'),
+        'last_success_timestamp_seconds': ('gauge', 'Time the table was last loaded'),
+        'skipped_total': ('counter', 'Loads skipped (journal or reference database)'),
+        'failures_total': ('counter', 'Failed loads of the table'),
+    }
+
+    def __init__(self, path, prefix='dck_load', labels=None):
+        self.path = path
+        self.prefix = prefix
+        self.labels = labels or {}
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def __call__(self, event):
+        phase = event['phase']
+        if phase not in ('done', 'skip', 'failed'):
+            return
+
+        key = (event.get('source') or '', event['table'])
+        with self.lock:
+            values = self.values.setdefault(key, {'skipped_total': 0, 'failures_total': 0})
+            if phase == 'done':
+                values.update({'rows': event['rows'],
+                               'bytes': event['bytes'],
+                               'duration_seconds': event['elapsed_s'],
+                               'rows_per_second': event['rows_per_s'],
+                               'last_success_timestamp_seconds': event['ts']})
+            elif phase == 'skip':
+                values['skipped_total'] += 1
+            else:
+                values['failures_total'] += 1
+            self.write()
+
+    def _labels(self, source, table):
+        labels = {**self.labels, 'source': source, 'table': table}
+        return ','.join(f'{k}="{v}"' for k, v in labels.items())
+
+    def write(self):
+        lines = []
+        for name, (kind, doc) in self.metrics.items():
+            metric = f'{self.prefix}_{name}'
+            lines.append(f'# HELP {metric} {doc}')
+            lines.append(f'# TYPE {metric} {kind}')
+            for (source, table), values in sorted(self.values.items()):
+                if values.get(name) is not None:
+                    lines.append(f'{metric}{{{self._labels(source, table)}}} {values[name]}')
+
+        tmp = f'{self.path}.{os.getpid()}.tmp'
+        with open(tmp, 'w', encoding='utf-8') as file:
+            file.write('\n'.join(lines) + '\n')
+        os.replace(tmp, self.path)
+
+
+class LoadProgress:
+    """Tracks the load of a table: rows, bytes and timings,
+       and sends its progress events to an emitter"""
+    def __init__(self, emit=None, source=None, table=None, index=None, total=None):
+        self.emit = emit or print_event
+        self.source = source
+        self.table = table
+        self.index = index
+        self.total = total
+        self.rows = 0
+        self.bytes = None
+        self.start_t = time.perf_counter()
+        self.last_t = self.start_t
+
+    def event(self, phase, message=None, **fields):
+        """Emits an event of the table"""
+        now = time.perf_counter()
+        elapsed = now - self.start_t
+        event = {'ts': round(time.time(), 3),
+                 'source': self.source,
+                 'table': self.table,
+                 'phase': phase,
+                 'index': self.index,
+                 'total': self.total,
+                 'rows': self.rows,
+                 'bytes': self.bytes,
+                 'elapsed_s': round(elapsed, 3),
+                 'phase_s': round(now - self.last_t, 3),
+                 'rows_per_s': round(self.rows / elapsed, 1) if elapsed > 0 else None,
+                 'message': message}
+        event.update(fields)
+        self.last_t = now
+        self.emit(event)
+
+    def batch(self, rows, nbytes=None):
+        """Records a batch of rows inserted in duckdb"""
+        self.rows += rows
+        if nbytes is not None:
+            self.bytes = (self.bytes or 0) + int(nbytes)
+        self.event('batch', batch_rows=rows)
+
+    def done(self, rows=None):
+        """Emits the end of the load, with its throughput"""
+        if rows is not None:
+            self.rows = rows
+        elapsed = time.perf_counter() - self.start_t
+        rate = f', {self.rows / elapsed:.0f} rows/s' if elapsed > 0 else ''
+        self.event('done', f'....loaded {self.rows} rows in {elapsed:.1f} s{rate}')
+
+    def failed(self, error):
+        self.event('failed', f'....failed: {error}', error=str(error))
@@ -0,0 +1,153 @@
+"""Parameterized Oracle extracts: typed bind variables, cached statements, streamed results"""
+
+import re
+from .readers import iter_query
+
+_bind_re = re.compile(r'(?<!:):([A-Za-z_]\w*)')
+_rows_re = re.compile(r'GEOMETRY_ROWS\(\s*:([A-Za-z_]\w*)\s*\)')
+
+
+def bind_names(sql):
+    """Returns the names of the bind variables referenced in a query
+       (string literals and comments are ignored)"""
+    sql = re.sub(r"'[^']*'|--[^\n]*|/\*.*?\*/", '', sql, flags=re.S)
+
+    return set(_bind_re.findall(sql))
+
+
+def geometry_rows_sql(name, count, srid='srid'):
+    """Returns the row source of a list of WKB geometries bound as :name_0..:name_<count-1>:
+       one row (GEOM_ID, GEOMETRY) per geometry, in the SRID bound to :srid
+       (NULL geometries, padding the list, are left out)"""
+    rows = ' UNION ALL '.join(f'SELECT {i} AS GEOM_ID, SDO_GEOMETRY(:{name}_{i}, :{srid}) AS GEOMETRY '
+                              f'FROM DUAL WHERE :{name}_{i} IS NOT NULL' for i in range(count))
+
+    return f'({rows})'
+
+
+def bucket_size(count):
+    """Returns the number of binds a list of count items is expanded to:
+       the next power of two, so that the query text only changes with the bucket"""
+    return 1 << max(count - 1, 0).bit_length()
+
+
+def list_items(name, binds):
+    """Returns the names of the expanded items of the list parameter name (see expand_binds)"""
+    return [n for n in binds if re.fullmatch(rf'{name}_\d+', n)]
+
+
+def expand_binds(sql, params):
+    """Returns the query and the bind variables it references, with list parameters expanded.
+       A list bound to :name becomes :name_0, :name_1... (e.g in an IN list),
+       and GEOMETRY_ROWS(:name) becomes the row source of its WKB geometries
+       (see geometry_rows_sql), to filter by several AOIs in a single query.
+       Lists are padded to a bucket size (see bucket_size): with their last item 
+       in an IN list, with NULL geometries in GEOMETRY_ROWS. The query text, and its 
+       parsed statement, is then reused for lists of about the same size"""
+    params = params or {}
+    binds = {}
+
+    def rows(m):
+        name = m.group(1)
+        value = list(params[name])
+        value += [None] * (bucket_size(len(value)) - len(value))
+        binds.update({f'{name}_{i}': x for i, x in enumerate(value)})
+        return geometry_rows_sql(name, len(value))
+    sql = _rows_re.sub(rows, sql)
+
+    for name in bind_names(sql) - set(binds):
+        if name not in params:
+            continue
+        value = params[name]
+        if isinstance(value, (list, tuple)):
+            # a repeated item doesn't change the result of IN (or NOT IN), NULL would
+            value = list(value) + list(value[-1:]) * (bucket_size(len(value)) - len(value))
+            items = ', '.join(f':{name}_{i}' for i in range(len(value)))
+            sql = re.sub(rf'(?<!:):{name}\b', items, sql)
+            binds.update({f'{name}_{i}': x for i, x in enumerate(value)})
+        else:
+            binds[name] = value
+
+    missing = bind_names(sql) - set(binds)
+    if missing:
+        raise Exception(f'Bind variables without value: {sorted(missing)}')
+
+    return sql, binds
+
+
+def lobs_as_values(cursor, name, default_type, size, precision, scale):
+    """Output type handler fetching CLOB/BLOB columns (e.g WKT geometries) as str/bytes,
+       in the fetch round trips, instead of LOB locators read one by one"""
+    import cx_Oracle
+
+    if default_type == cx_Oracle.DB_TYPE_CLOB:
+        return cursor.var(cx_Oracle.DB_TYPE_LONG, arraysize=cursor.arraysize)
+    if default_type == cx_Oracle.DB_TYPE_BLOB:
+        return cursor.var(cx_Oracle.DB_TYPE_LONG_RAW, arraysize=cursor.arraysize)
+
+
+class OracleExtract:
+    """Runs parameterized extracts on an Oracle connection.
+       Bind variables are typed from their values (bytes are bound as BLOB)
+       unless given in types ({name: cx_Oracle type}). The SQL text of a query is
+       stable across runs (lists are padded to bucket sizes), so its parsed statement 
+       is reused from the statement cache.
+       Results are streamed in batches, never fetched all at once, 
+       with LOB columns fetched as values"""
+    def __init__(self, orcCnx, stmtcachesize=50, arraysize=10000):
+        self.orcCnx = orcCnx
+        self.arraysize = arraysize
+        if orcCnx.stmtcachesize < stmtcachesize:
+            orcCnx.stmtcachesize = stmtcachesize
+
+    def prepare(self, sql, params=None, types=None):
+        """Returns the query, its bind variables (see expand_binds) 
+           and the types to bind them with (see input_sizes)"""
+        sql, binds = expand_binds(sql, params)
+        
+        return sql, binds, self.input_sizes(binds, types, params)
+
+    def input_sizes(self, binds, types=None, params=None):
+        """Returns the types of the bind variables that can't be inferred by cx_Oracle.
+           A type given for a list parameter of params applies to all its items"""
+        import cx_Oracle
+
+        sizes = {n: cx_Oracle.DB_TYPE_BLOB for n, x in binds.items() if isinstance(x, bytes)}
+        # the NULL padding of a list of WKB is typed as its items
+        for name, value in (params or {}).items():
+            if isinstance(value, (list, tuple)) and any(isinstance(x, bytes) for x in value):
+                sizes.update({n: cx_Oracle.DB_TYPE_BLOB for n in list_items(name, binds)})
+        for name, typ in (types or {}).items():
+            value = (params or {}).get(name)
+            if isinstance(value, (list, tuple)):
+                sizes.update({n: typ for n in list_items(name, binds)})
+            elif name in binds:
+                sizes[name] = typ
+
+        return sizes
+
+    def iter_batches(self, sql, params=None, types=None, budget=None, progress=None,
+                     dtypes=None):
+        """Yields the results of a query as dataframes, in batches of arraysize rows
+           (or sized to fit the memory budget). The first batch is always yielded.
+           Columns are typed from their declaration, unless given in dtypes 
+           ({column: dtype}, see iter_query)"""
+        yield from self.iter_prepared(*self.prepare(sql, params, types), budget, progress,
+                                      dtypes)
+
+    def iter_prepared(self, sql, binds, sizes=None, budget=None, progress=None, dtypes=None):
+        """Yields the results of a prepared query (see prepare), as iter_batches"""
+        cursor = self.orcCnx.cursor()
+        try:
+            cursor.setinputsizes(**(sizes or {}))
+            cursor.outputtypehandler = lobs_as_values
+            yield from iter_query(cursor, sql, binds, budget, self.arraysize, progress, dtypes)
+        finally:
+            cursor.close()
+
+    def read_df(self, sql, params=None, types=None, dtypes=None):
+        """Returns the results of a query as a dataframe"""
+        import pandas as pd
+
+        return pd.concat(list(self.iter_batches(sql, params, types, dtypes=dtypes)), 
+                         ignore_index=True)
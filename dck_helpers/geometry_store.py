@@ -0,0 +1,457 @@
+"""
+Compact columnar store of the geometries of a duckdb result.
+
+Geometries are held GeoArrow-style in a few NumPy buffers instead of one shapely
+object per feature:
+    coords        float64 (n_coords, 2) x/y of all the vertices
+    ring_offsets  coords of each ring (or linestring, or point)
+    part_offsets  rings of each part (polygon, linestring, point)
+    geom_offsets  parts of each geometry
+    geom_types    WKB geometry type of each geometry (1 to 6)
+
+Every geometry has parts, made of rings, made of coords: a Polygon is one part,
+a MultiPolygon several, a LineString one part with one ring, a Point one part
+with one ring of one coord. Empty and null geometries (type 0) have no parts.
+The WKB exported by duckdb (through arrow) is parsed into the buffers without shapely,
+all the geometries at once (vectorized NumPy gathers, no loop over the geometries).
+"""
+
+import struct
+import numpy as np
+
+POINT, LINESTRING, POLYGON, MULTIPOINT, MULTILINESTRING, MULTIPOLYGON = range(1, 7)
+
+# extra dimensions of the ISO WKB types (1000s: Z, 2000s: M, 3000s: ZM)
+_iso_dims = np.array([0, 1, 1, 2])
+
+# below this number of geometries, the remaining parts (or rings) are read one by one
+_scalar_below = 32
+
+
+def _ranges(starts, ends):
+    """Returns the concatenation of the ranges [starts[i], ends[i])"""
+    counts = ends - starts
+    if counts.sum() == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    offsets = np.repeat(starts - np.concatenate([[0], np.cumsum(counts)[:-1]]), counts)
+
+    return np.arange(counts.sum(), dtype=np.int64) + offsets
+
+
+def _rebase(offsets, idx):
+    """Returns the offsets of the selected items, starting at 0"""
+    counts = offsets[idx + 1] - offsets[idx]
+
+    return np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+
+
+def _read_values(data, pos, little, dtype, views=None):
+    """Returns the values of dtype ('u4' or 'f8') at the byte positions pos
+       of a WKB buffer (uint8 array), little or big endian.
+       The shifted views of the buffer are cached in views (dict), if provided"""
+    size = np.dtype(dtype).itemsize
+    views = {} if views is None else views
+    out = np.empty(len(pos), dtype=dtype)
+
+    for is_little, order in ((True, '<'), (False, '>')):
+        sel = little == is_little
+        if not sel.any():
+            continue
+        p = pos[sel]
+        values = np.empty(len(p), dtype=dtype)
+        # unaligned values are read from a view of the buffer shifted by their offset
+        shift = p % size
+        for s in np.unique(shift):
+            key = (order + dtype, s)
+            if key not in views:
+                views[key] = np.frombuffer(data, dtype=order + dtype,
+                                           count=(len(data) - s) // size, offset=s)
+            m = shift == s
+            values[m] = views[key][(p[m] - s) // size]
+        out[sel] = values
+
+    return out
+
+
+class _WKBReader:
+    """Parses a buffer of WKB geometries, all the geometries at once: headers, counts
+       and coordinates are read by vectorized gathers, with one pass per part index
+       (of the multi geometries) and ring index (of the polygons), not per geometry.
+       The last parts (rings) of the few geometries with many of them are read one by one"""
+    def __init__(self, data):
+        self.data = data
+        self.views = {}
+        # geometry, part and ring index, coords position, count, dimensions, byte order
+        self.rings = []
+        self.scalar_rings = []
+
+    def read_header(self, pos):
+        """Returns the byte order, type, dimensions and body position of the geometries at pos"""
+        little = self.data[pos] == 1
+        wkb_type = _read_values(self.data, pos + 1, little, 'u4', self.views).astype(np.int64)
+
+        # ISO (1000s) and EWKB (flags) Z/M dimensions: only x/y are kept
+        dims = 2 + (wkb_type & 0x80000000 > 0) + (wkb_type & 0x40000000 > 0)
+        pos = pos + 5 + 4 * (wkb_type & 0x20000000 > 0)  # EWKB SRID
+        wkb_type &= 0x0FFFFFFF
+        iso = wkb_type // 1000
+        if (iso > 3).any():
+            raise Exception(f'WKB geometry type {wkb_type[iso > 3][0]} not supported')
+        dims = dims + _iso_dims[iso]
+
+        return little, wkb_type % 1000, dims, pos
+
+    def add_rings(self, geom, part, ring, pos, count, dims, little):
+        self.rings.append((geom, part, np.full(len(geom), ring), pos, count, dims, little))
+
+    def _uint32(self, pos, little):
+        return struct.unpack_from('<I' if little else '>I', self.data, pos)[0]
+
+    def walk_rings(self, geom, part, ring, n_rings, pos, dims, little):
+        """Reads the rings ring..n_rings-1 of a polygon one by one,
+           returns the position after them"""
+        for k in range(ring, n_rings):
+            count = self._uint32(pos, little)
+            self.scalar_rings.append((geom, part, k, pos + 4, count, dims, little))
+            pos += 4 + count * dims * 8
+
+        return pos
+
+    def walk_parts(self, geom, part, n_parts, pos, multi_type):
+        """Reads the parts part..n_parts-1 of a multi geometry one by one"""
+        for j in range(part, n_parts):
+            little = self.data[pos] == 1
+            wkb_type = self._uint32(pos + 1, little)
+            dims = 2 + bool(wkb_type & 0x80000000) + bool(wkb_type & 0x40000000)
+            pos += 5 + 4 * bool(wkb_type & 0x20000000)
+            wkb_type &= 0x0FFFFFFF
+            dims += int(_iso_dims[wkb_type // 1000])
+            if wkb_type % 1000 != multi_type - 3:
+                raise Exception(f'WKB geometry type {multi_type} not supported '
+                                '(Point, LineString, Polygon and their Multi types)')
+
+            if multi_type == MULTIPOINT:
+                self.scalar_rings.append((geom, j, 0, pos, 1, dims, little))
+                pos += dims * 8
+            elif multi_type == MULTILINESTRING:
+                pos = self.walk_rings(geom, j, 0, 1, pos, dims, little)
+            else:
+                pos = self.walk_rings(geom, j, 0, self._uint32(pos, little), pos + 4, dims, little)
+
+    def read_single(self, geom, part, little, geom_type, dims, pos):
+        """Reads Points, LineStrings and Polygons, returns the positions after them"""
+        unknown = ~np.isin(geom_type, (POINT, LINESTRING, POLYGON))
+        if unknown.any():
+            raise Exception(f'WKB geometry type {geom_type[unknown][0]} not supported '
+                            '(Point, LineString, Polygon and their Multi types)')
+        end = pos.copy()
+
+        m = geom_type == POINT
+        self.add_rings(geom[m], part[m], 0, pos[m], np.ones(m.sum(), dtype=np.int64),
+                       dims[m], little[m])
+        end[m] = pos[m] + dims[m] * 8
+
+        m = geom_type == LINESTRING
+        count = _read_values(self.data, pos[m], little[m], 'u4', self.views).astype(np.int64)
+        self.add_rings(geom[m], part[m], 0, pos[m] + 4, count, dims[m], little[m])
+        end[m] = pos[m] + 4 + count * dims[m] * 8
+
+        m = geom_type == POLYGON
+        geom, part, little, dims = geom[m], part[m], little[m], dims[m]
+        n_rings = _read_values(self.data, pos[m], little, 'u4', self.views).astype(np.int64)
+        cur = pos[m] + 4
+        for k in range(n_rings.max(initial=0)):
+            a = n_rings > k
+            if a.sum() < _scalar_below:
+                for i in np.flatnonzero(a):
+                    cur[i] = self.walk_rings(int(geom[i]), int(part[i]), k, int(n_rings[i]),
+                                             int(cur[i]), int(dims[i]), bool(little[i]))
+                break
+            count = _read_values(self.data, cur[a], little[a], 'u4', self.views).astype(np.int64)
+            self.add_rings(geom[a], part[a], k, cur[a] + 4, count, dims[a], little[a])
+            cur[a] += 4 + count * dims[a] * 8
+        end[m] = cur
+
+        return end
+
+    def read(self, geom, pos):
+        """Reads the geometries at pos, returns their types"""
+        little, geom_type, dims, pos = self.read_header(pos)
+
+        single = geom_type <= POLYGON
+        self.read_single(geom[single], np.zeros(single.sum(), dtype=np.int64),
+                         little[single], geom_type[single], dims[single], pos[single])
+
+        # parts of the multi geometries, one part index at a time
+        multi = ~single
+        geom, multi_type, little = geom[multi], geom_type[multi], little[multi]
+        n_parts = _read_values(self.data, pos[multi], little, 'u4', self.views).astype(np.int64)
+        cur = pos[multi] + 4
+        for j in range(n_parts.max(initial=0)):
+            a = n_parts > j
+            if a.sum() < _scalar_below:
+                for i in np.flatnonzero(a):
+                    self.walk_parts(int(geom[i]), j, int(n_parts[i]), int(cur[i]),
+                                    int(multi_type[i]))
+                break
+            part_little, part_type, part_dims, part_pos = self.read_header(cur[a])
+            wrong = part_type != multi_type[a] - 3
+            if wrong.any():
+                raise Exception(f'WKB geometry type {multi_type[a][wrong][0]} not supported '
+                                '(Point, LineString, Polygon and their Multi types)')
+            cur[a] = self.read_single(geom[a], np.full(a.sum(), j), part_little, part_type,
+                                      part_dims, part_pos)
+
+        return geom_type
+
+    def read_rings(self):
+        """Returns the geometry, part and vertex count of the non empty rings,
+           in order, and their coordinates"""
+        if self.scalar_rings:
+            self.rings.append(tuple(np.array(c) for c in zip(*self.scalar_rings)))
+            self.scalar_rings = []
+        if not self.rings:
+            return (np.zeros(0, dtype=np.int64),) * 3 + (np.zeros((0, 2)),)
+
+        geom, part, ring, pos, count, dims, little = (np.concatenate(c) for c in zip(*self.rings))
+        order = np.lexsort((ring, part, geom))
+        geom, part, pos, count, dims, little = (a[order] for a in (geom, part, pos, count,
+                                                                   dims, little))
+
+        coord_ring = np.repeat(np.arange(len(count)), count)
+        starts = np.cumsum(count) - count
+        coord_pos = pos[coord_ring] + (np.arange(len(coord_ring)) - starts[coord_ring]) \
+            * dims[coord_ring] * 8
+        coords = np.empty((len(coord_pos), 2))
+        coords[:, 0] = _read_values(self.data, coord_pos, little[coord_ring], 'f8', self.views)
+        coords[:, 1] = _read_values(self.data, coord_pos + 8, little[coord_ring], 'f8', self.views)
+
+        # empty rings are skipped (an empty point is written as NaN coordinates)
+        empty = count == 0
+        single = np.flatnonzero(count == 1)
+        empty[single] = np.isnan(coords[starts[single]]).all(axis=1)
+        if empty.any():
+            coords = coords[~empty[coord_ring]]
+            geom, part, count = geom[~empty], part[~empty], count[~empty]
+
+        return geom, part, count, coords
+
+
+class GeometryStore:
+    """Columnar store of geometries (see the module docstring) and their attributes
+       (arrow table), with vectorized area, bounds and bbox predicates.
+       Shapely geometries are only created by to_geodataframe"""
+    def __init__(self, coords, ring_offsets, part_offsets, geom_offsets, geom_types,
+                 attributes=None, crs=None):
+        self.coords = coords
+        self.ring_offsets = ring_offsets
+        self.part_offsets = part_offsets
+        self.geom_offsets = geom_offsets
+        self.geom_types = geom_types
+        self.attributes = attributes
+        self.crs = crs
+
+    @classmethod
+    def from_wkb(cls, wkb_array, attributes=None, crs=None):
+        """Returns a store from an arrow binary array of WKB (nulls are empty geometries).
+           The WKB buffer is read in place: only the coordinates are copied, once"""
+        n_geoms = 0
+        geom_types = []
+        rings = []
+
+        chunks = wkb_array.chunks if hasattr(wkb_array, 'chunks') else [wkb_array]
+        for chunk in chunks:
+            _, offsets, data = chunk.buffers()[:3]
+            offset_type = np.int64 if str(chunk.type) == 'large_binary' else np.int32
+            offsets = np.frombuffer(offsets, dtype=offset_type)[chunk.offset:
+                                                               chunk.offset + len(chunk) + 1]
+            data = np.frombuffer(data, dtype=np.uint8) if data is not None else np.zeros(0, np.uint8)
+            valid = ~chunk.is_null().to_numpy(zero_copy_only=False)
+
+            types = np.zeros(len(chunk), dtype=np.uint8)
+            reader = _WKBReader(data)
+            geom = np.flatnonzero(valid)
+            types[geom] = reader.read(geom + n_geoms, offsets[:-1][valid].astype(np.int64))
+            geom_types.append(types)
+            rings.append(reader.read_rings())
+            n_geoms += len(chunk)
+
+        geom, part, count, coords = (np.concatenate(c) for c in zip(*rings)) if rings \
+            else ((np.zeros(0, dtype=np.int64),) * 3 + (np.zeros((0, 2)),))
+
+        # a part starts at each change of (geometry, part) of the rings
+        new_part = np.ones(len(geom), dtype=bool)
+        new_part[1:] = (geom[1:] != geom[:-1]) | (part[1:] != part[:-1])
+        part_starts = np.flatnonzero(new_part)
+        parts_per_geom = np.bincount(geom[part_starts], minlength=n_geoms)
+
+        return cls(np.ascontiguousarray(coords, dtype=np.float64),
+                   np.concatenate([[0], np.cumsum(count)]).astype(np.int64),
+                   np.concatenate([part_starts, [len(geom)]]).astype(np.int64),
+                   np.concatenate([[0], np.cumsum(parts_per_geom)]).astype(np.int64),
+                   np.concatenate(geom_types) if geom_types else np.zeros(0, dtype=np.uint8),
+                   attributes, crs)
+
+    @classmethod
+    def from_duckdb(cls, conn, table, geom_col=None):
+        """Returns a store from a duckdb table (name) or relation. The geometries
+           are exported as WKB through arrow, the other columns kept as attributes"""
+        import duckdb
+        from .catalog import get_layer_crs
+
+        crs = None
+        if isinstance(table, duckdb.DuckDBPyRelation):
+            rel = table
+        else:
+            rel = conn.table(table)
+            crs = get_layer_crs(conn, table)
+
+        if geom_col is None:
+            geom_col = next(c for c, t in zip(rel.columns, rel.types) if str(t) == 'GEOMETRY')
+
+        arrow = rel.project(f'* EXCLUDE "{geom_col}", '
+                            f'ST_AsWKB("{geom_col}") AS "{geom_col}"').fetch_arrow_table()
+        wkb_array = arrow.column(geom_col)
+        attributes = arrow.drop([geom_col])
+        del arrow
+
+        return cls.from_wkb(wkb_array, attributes, crs)
+
+    def __len__(self):
+        return len(self.geom_types)
+
+    @property
+    def nbytes(self):
+        """Size (bytes) of the geometry buffers"""
+        return sum(a.nbytes for a in (self.coords, self.ring_offsets, self.part_offsets,
+                                       self.geom_offsets, self.geom_types))
+
+    def _geom_coord_offsets(self):
+        """Returns the coords offsets of each geometry"""
+        return self.ring_offsets[self.part_offsets[self.geom_offsets]]
+
+    def num_points(self):
+        """Returns the number of vertices of each geometry"""
+        return np.diff(self._geom_coord_offsets())
+
+    def bounds(self):
+        """Returns the bounds (n, 4: xmin, ymin, xmax, ymax) of each geometry,
+           NaN for empty geometries"""
+        offsets = self._geom_coord_offsets()
+        starts, counts = offsets[:-1], np.diff(offsets)
+        bounds = np.full((len(self), 4), np.nan)
+        nonempty = counts > 0
+        if len(self.coords):
+            idx = starts[nonempty]
+            bounds[nonempty, :2] = np.minimum.reduceat(self.coords, idx)
+            # reduceat stops at the next start: empty geometries have no coords
+            bounds[nonempty, 2:] = np.maximum.reduceat(self.coords, idx)
+
+        return bounds
+
+    def total_bounds(self):
+        """Returns the bounds (xmin, ymin, xmax, ymax) of all the geometries"""
+        if len(self.coords) == 0:
+            return (np.nan,) * 4
+
+        return (*self.coords.min(axis=0), *self.coords.max(axis=0))
+
+    def area(self):
+        """Returns the area of each geometry (shoelace formula per ring,
+           holes subtracted), 0 for points and lines"""
+        starts, counts = self.ring_offsets[:-1], np.diff(self.ring_offsets)
+        ring_of = np.repeat(np.arange(len(counts)), counts)
+
+        # coordinates relative to the first vertex of their ring, for precision
+        x = self.coords[:, 0] - self.coords[starts[ring_of], 0]
+        y = self.coords[:, 1] - self.coords[starts[ring_of], 1]
+        cross = np.zeros(len(x))
+        cross[:-1] = x[:-1] * y[1:] - x[1:] * y[:-1]
+        # the term of the last vertex of a ring spans two rings
+        cross[self.ring_offsets[1:][counts > 0] - 1] = 0
+
+        ring_area = np.abs(np.bincount(ring_of, weights=cross, minlength=len(counts))) / 2
+
+        # holes: rings after the first one of their part
+        hole = np.ones(len(counts), dtype=bool)
+        hole[self.part_offsets[:-1][np.diff(self.part_offsets) > 0]] = False
+        ring_area[hole] *= -1
+
+        # polygon types only
+        ring_geom = np.repeat(np.repeat(np.arange(len(self)), np.diff(self.geom_offsets)),
+                              np.diff(self.part_offsets))
+        polygonal = np.isin(self.geom_types, (POLYGON, MULTIPOLYGON))
+        ring_area[~polygonal[ring_geom]] = 0
+
+        return np.bincount(ring_geom, weights=ring_area, minlength=len(self))
+
+    def intersects_bbox(self, xmin, ymin, xmax, ymax):
+        """Returns a mask of the geometries whose bounds intersect the bbox"""
+        b = self.bounds()
+        with np.errstate(invalid='ignore'):
+            return (b[:, 0] <= xmax) & (b[:, 2] >= xmin) & (b[:, 1] <= ymax) & (b[:, 3] >= ymin)
+
+    def within_bbox(self, xmin, ymin, xmax, ymax):
+        """Returns a mask of the geometries entirely within the bbox"""
+        b = self.bounds()
+        with np.errstate(invalid='ignore'):
+            return (b[:, 0] >= xmin) & (b[:, 2] <= xmax) & (b[:, 1] >= ymin) & (b[:, 3] <= ymax)
+
+    def take(self, indices):
+        """Returns a store of the selected geometries (indices or boolean mask)"""
+        idx = np.asarray(indices)
+        if idx.dtype == bool:
+            idx = np.flatnonzero(idx)
+
+        parts = _ranges(self.geom_offsets[idx], self.geom_offsets[idx + 1])
+        rings = _ranges(self.part_offsets[parts], self.part_offsets[parts + 1])
+        coords = _ranges(self.ring_offsets[rings], self.ring_offsets[rings + 1])
+
+        attributes = self.attributes.take(idx) if self.attributes is not None else None
+
+        return GeometryStore(self.coords[coords],
+                             _rebase(self.ring_offsets, rings),
+                             _rebase(self.part_offsets, parts),
+                             _rebase(self.geom_offsets, idx),
+                             self.geom_types[idx],
+                             attributes, self.crs)
+
+    def to_shapely(self):
+        """Returns the geometries as an array of shapely geometries"""
+        import shapely
+
+        types = set(np.unique(self.geom_types[self.geom_types > 0]))
+        # geometries are built as their multi type, single parts are then extracted
+        if types <= {POLYGON, MULTIPOLYGON}:
+            geoms = shapely.from_ragged_array(shapely.GeometryType.MULTIPOLYGON, self.coords,
+                                              (self.ring_offsets, self.part_offsets,
+                                               self.geom_offsets))
+            single = self.geom_types == POLYGON
+        elif types <= {LINESTRING, MULTILINESTRING}:
+            geoms = shapely.from_ragged_array(shapely.GeometryType.MULTILINESTRING, self.coords,
+                                              (self.ring_offsets,
+                                               self.part_offsets[self.geom_offsets]))
+            single = self.geom_types == LINESTRING
+        elif types <= {POINT, MULTIPOINT}:
+            geoms = shapely.from_ragged_array(shapely.GeometryType.MULTIPOINT, self.coords,
+                                              (self.ring_offsets[self.part_offsets[self.geom_offsets]],))
+            single = self.geom_types == POINT
+        else:
+            raise Exception('Mixed geometry types (polygons, lines, points) are not supported')
+
+        # empty geometries stay empty multi geometries, nulls are None
+        single &= np.diff(self.geom_offsets) > 0
+        geoms[single] = shapely.get_geometry(geoms[single], 0)
+        geoms[self.geom_types == 0] = None
+
+        return geoms
+
+    def to_geodataframe(self):
+        """Returns a GeoDataFrame of the attributes and geometries"""
+        import pandas as pd
+        import geopandas as gpd
+
+        df = self.attributes.to_pandas() if self.attributes is not None else pd.DataFrame(index=range(len(self)))
+
+        return gpd.GeoDataFrame(df, geometry=self.to_shapely(), crs=self.crs)
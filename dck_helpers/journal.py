@@ -0,0 +1,115 @@
+import os
+import hashlib
+
+
+def fingerprint_sql(sql, bvars=None):
+    """Returns a fingerprint of a SQL statement and its bind variables"""
+    md5 = hashlib.md5()
+    md5.update(' '.join(sql.split()).encode('utf-8'))
+
+    if bvars:
+        for k in sorted(bvars):
+            v = bvars[k]
+            if not isinstance(v, bytes):
+                v = str(v).encode('utf-8')
+            md5.update(k.encode('utf-8'))
+            md5.update(v)
+
+    return md5.hexdigest()
+
+
+def fingerprint_source(path):
+    """Returns a fingerprint of a local source (shp or featureclass/gdb)
+       based on the name, size and modification time of its files"""
+    if '.gdb' in path:
+        l = path.split('.gdb')
+        files_dir = l[0] + '.gdb'
+        prefix = ''
+    else:
+        files_dir = os.path.dirname(path)
+        prefix = os.path.splitext(os.path.basename(path))[0] + '.'
+
+    md5 = hashlib.md5()
+    md5.update(path.encode('utf-8'))
+    for f in sorted(os.listdir(files_dir)):
+        if f.startswith(prefix):
+            st = os.stat(os.path.join(files_dir, f))
+            md5.update(f'{f}|{st.st_size}|{st.st_mtime_ns}'.encode('utf-8'))
+
+    return md5.hexdigest()
+
+
+class RunJournal:
+    """Records the completed steps of a pipeline run in the duckdb database,
+       so that a rerun skips them and resumes at the failed step"""
+    def __init__(self, dckCnx, run_name='default', table='run_journal'):
+        self.dckCnx = dckCnx
+        self.run_name = run_name
+        self.table = table
+        self.create_journal()
+
+    def create_journal(self):
+        """Creates the journal table if it doesn't exist.
+           A load and a query may share a name: steps are keyed by name and type"""
+        self.dckCnx.execute(f"""
+            CREATE TABLE IF NOT EXISTS {self.table} (
+                run_name VARCHAR,
+                step VARCHAR,
+                step_type VARCHAR,
+                fingerprint VARCHAR,
+                status VARCHAR,
+                row_count BIGINT,
+                message VARCHAR,
+                updated_at TIMESTAMP,
+                PRIMARY KEY (run_name, step, step_type)
+            );
+            """)
+
+    def is_completed(self, step, step_type, fingerprint):
+        """Returns True if the step completed with the same input fingerprint"""
+        row = self.dckCnx.execute(f"""
+            SELECT status, fingerprint
+            FROM {self.table}
+            WHERE run_name = ? AND step = ? AND step_type = ?
+            """, [self.run_name, step, step_type]).fetchone()
+
+        return row is not None and row[0] == 'COMPLETED' and row[1] == fingerprint
+
+    def _record(self, step, step_type, fingerprint, status, row_count=None, message=None):
+        self.dckCnx.execute(f"""
+            INSERT OR REPLACE INTO {self.table}
+            VALUES (?, ?, ?, ?, ?, ?, ?, now()::TIMESTAMP)
+            """, [self.run_name, step, step_type, fingerprint,
+                  status, row_count, message])
+
+    def mark_completed(self, step, step_type, fingerprint, row_count=None):
+        """Records a completed step"""
+        self._record(step, step_type, fingerprint, 'COMPLETED', row_count)
+
+    def mark_failed(self, step, step_type, fingerprint, message):
+        """Records a failed step"""
+        self._record(step, step_type, fingerprint, 'FAILED', None, str(message)[:1000])
+
+    def completed_fingerprints(self, step_types, steps=None):
+        """Returns the fingerprints of the completed steps of some types (a type or a list),
+           only of the listed steps if any, used as inputs fingerprint of a downstream step"""
+        if isinstance(step_types, str):
+            step_types = [step_types]
+        rows = self.dckCnx.execute(f"""
+            SELECT step || ':' || step_type || ':' || fingerprint
+            FROM {self.table}
+            WHERE run_name = ? AND list_contains(?, step_type) AND status = 'COMPLETED'
+                AND (?::VARCHAR[] IS NULL OR list_contains(?::VARCHAR[], step))
+            ORDER BY step, step_type
+            """, [self.run_name, list(step_types), steps, steps]).fetchall()
+
+        return ','.join(r[0] for r in rows)
+
+    def reset(self, step=None):
+        """Clears the journal of the run (or of a single step) to force a full rerun"""
+        if step is None:
+            self.dckCnx.execute(f"DELETE FROM {self.table} WHERE run_name = ?",
+                                [self.run_name])
+        else:
+            self.dckCnx.execute(f"DELETE FROM {self.table} WHERE run_name = ? AND step = ?",
+                                [self.run_name, step])
@@ -0,0 +1,487 @@
+"""Loaders of Oracle, GDB and shapefile layers into duckdb"""
+
+import duckdb
+from pathlib import Path
+from typing import Callable, List, Optional
+from .aoi import AOI
+from .catalog import (table_exists, layer_kind, drop_layer, geometry_expr, record_layer_crs,
+                      get_layer_crs, same_crs)
+from .journal import fingerprint_sql, fingerprint_source
+from .events import LoadProgress
+from .extract import OracleExtract
+from .memory import row_width
+from .readers import esri_crs, esri_to_arrow, iter_esri_arrow
+from .reference import use_reference_layer
+
+
+def load_df_to_duckdb(dckCnx, table, df, geom_func, src_crs=None, target_crs=None, 
+                      force_2d=True, progress=None, force=False):
+    """Creates a duckdb table from a dataframe (or arrow table), unless the table already 
+       holds the same columns and row count in the same CRS (and force is False). 
+       geom_func is the duckdb function converting the GEOMETRY column 
+       (ST_GeomFromText or ST_GeomFromWKB).
+       Geometries are reprojected to target_crs in the same statement.
+       The rows and bytes loaded are recorded in progress (LoadProgress).
+       Returns True if the table was (re)created"""
+    progress = progress or LoadProgress(table=table)
+    
+    if not force and table_exists(dckCnx, table):
+        dck_row_count= dckCnx.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+        dck_col_nams= dckCnx.table(table).columns
+        
+        if hasattr(df, 'column_names'):  # arrow table
+            df_col_nams= df.column_names
+        else:
+            df_col_nams= df.columns
+        
+        # a table loaded in another CRS is reloaded (and reprojected)
+        if ((dck_row_count == len(df)) and (set(df_col_nams) == set(dck_col_nams))
+                and same_crs(get_layer_crs(dckCnx, table), target_crs or src_crs)):
+            progress.event('skip', '....data already in db: skip importing')
+            return False
+    
+    progress.event('ingest', f'....import to Duckdb ({len(df)} rows)')
+    geom = geometry_expr(f'{geom_func}(geometry)', src_crs, target_crs)
+    # the layer may have been a view on a reference database
+    drop_layer(dckCnx, table, 'VIEW')
+    create_table_query = f"""
+    CREATE OR REPLACE TABLE {table} AS
+      SELECT * EXCLUDE geometry, {geom} AS GEOMETRY
+      FROM df;
+    """
+    dckCnx.execute(create_table_query)
+    progress.batch(len(df), row_width(df) * len(df))
+    
+    record_layer_crs(dckCnx, table, src_crs, target_crs, force_2d, progress)
+    
+    return True
+
+
+def load_batches_to_duckdb(dckCnx, table, batches, geom_func, src_crs=None, target_crs=None,
+                           force_2d=True, progress=None):
+    """Creates a duckdb table from an iterator of dataframes (or arrow tables), 
+       one batch at a time: a batch is released as soon as it is inserted, 
+       so that a single batch is held in memory. 
+       An integer column of the table is widened to DOUBLE when a later batch 
+       holds decimals in it (see iter_query).
+       Each batch is recorded in progress (LoadProgress).
+       Returns the number of rows loaded"""
+    progress = progress or LoadProgress(table=table)
+    
+    geom = geometry_expr(f'{geom_func}(geometry)', src_crs, target_crs)
+    # the layer may have been a view on a reference database
+    drop_layer(dckCnx, table, 'VIEW')
+    
+    row_count = 0
+    width = 0
+    for i, batch in enumerate(batches):
+        # bytes are estimated from the row width of the first (non empty) batch
+        if not width:
+            width = row_width(batch)
+        if i == 0:
+            dckCnx.execute(f"""
+                CREATE OR REPLACE TABLE {table} AS
+                  SELECT * EXCLUDE geometry, {geom} AS GEOMETRY
+                  FROM batch;
+                """)
+            int_cols = {c for c, in dckCnx.execute("""SELECT column_name FROM duckdb_columns() 
+                                                      WHERE table_name = ? AND data_type = 'BIGINT'
+                                                        AND database_name = current_database()""",
+                                                   [table]).fetchall()}
+        else:
+            # dataframe batches only: the schema of arrow batches doesn't change
+            widened = [c for c in int_cols 
+                       if c in getattr(batch, 'dtypes', {}) and batch[c].dtype.kind == 'f']
+            for c in widened:
+                dckCnx.execute(f'ALTER TABLE {table} ALTER "{c}" TYPE DOUBLE')
+            int_cols -= set(widened)
+            dckCnx.execute(f"""
+                INSERT INTO {table}
+                  SELECT * EXCLUDE geometry, {geom} AS GEOMETRY
+                  FROM batch;
+                """)
+        row_count += len(batch)
+        progress.batch(len(batch), width * len(batch))
+        del batch
+    
+    progress.event('ingest', f'....imported to Duckdb ({row_count} rows)')
+    record_layer_crs(dckCnx, table, src_crs, target_crs, force_2d, progress)
+    
+    return row_count
+
+
+def simplify_table(dckCnx, table, tolerance=None, grid_size=0.01, progress=None):
+    """Snaps the geometries of a duckdb table to a grid of grid_size 
+       and simplifies them within tolerance (topology preserved).
+       The area and vertex count before and after are sent to progress 
+       (simplify event) and returned"""
+    progress = progress or LoadProgress(table=table)
+    
+    expr = 'geometry'
+    if grid_size:
+        expr = f'ST_ReducePrecision({expr}, {grid_size})'
+    if tolerance:
+        expr = f'ST_SimplifyPreserveTopology({expr}, {tolerance})'
+    
+    stats_sql = f"""SELECT 
+                        COALESCE(SUM(ST_Area(geometry)), 0), 
+                        COALESCE(SUM(ST_NPoints(geometry)), 0) 
+                    FROM {table}"""
+    
+    area_before, vertices_before = dckCnx.execute(stats_sql).fetchone()
+    dckCnx.execute(f"""
+        CREATE OR REPLACE TABLE {table} AS
+          SELECT * REPLACE ({expr} AS geometry)
+          FROM {table};
+        """)
+    area_after, vertices_after = dckCnx.execute(stats_sql).fetchone()
+    
+    area_change_pct = 0.0
+    if area_before:
+        area_change_pct = round((area_after - area_before) / area_before * 100, 4)
+    
+    stats = {'table_name': table,
+             'vertices_before': vertices_before,
+             'vertices_after': vertices_after,
+             'area_before': area_before,
+             'area_after': area_after,
+             'area_change_pct': area_change_pct}
+    # the stats are recorded in the event (e.g in the JSON lines of a job)
+    progress.event('simplify', f'....simplified (grid {grid_size}, tolerance {tolerance}): '
+                   f'{vertices_before} -> {vertices_after} vertices, area change {area_change_pct}%',
+                   grid_size=grid_size, tolerance=tolerance,
+                   **{n: x for n, x in stats.items() if n != 'table_name'})
+    
+    return stats
+
+
+def oracle_2_duckdb(orcCnx, dckCnx, dict_sqls, journal=None, bvars=None, 
+                    simplify=None, grid_size=0.01, src_crs=None, target_crs=None, aoi=None,
+                    ref_db=None, budget=None, types=None, emit=None, dtypes=None):
+    """Insert data from Oracle into a duckdb table. 
+       Bind variables referenced in a query (e.g :wkb_aoi, :srid) are taken from bvars,
+       typed from their values or by types ({name: cx_Oracle type}). Lists are expanded, 
+       and GEOMETRY_ROWS(:name) is the row source of a list of WKB (see expand_binds).
+       Columns are typed from their Oracle declaration, unless given in dtypes
+       ({column: dtype}, e.g 'Int64' for an ID declared as NUMBER; see iter_query).
+       With an AOI, AOI_FILTER(<geometry column>) in a query is replaced by 
+       the AOI spatial predicate and :wkb_aoi/:srid are bound to the AOI.
+       Geometries are in src_crs (e.g 'EPSG:3005' for BCGW), and reprojected to target_crs.
+       Tables listed in simplify ({table: tolerance}) are simplified after loading.
+       Tables found in the attached reference database ref_db are not imported.
+       Results are streamed from Oracle and inserted in batches, sized to fit 
+       the memory budget if any (tables are always reloaded, unless journaled).
+       Progress events (see dck_helpers.events) are sent to emit (default: printed).
+       Returns lazy duckdb relations of the loaded tables"""
+    extract = OracleExtract(orcCnx)
+    tables = {}
+    counter = 1
+    
+    for k, v in dict_sqls.items():
+        progress = LoadProgress(emit, 'oracle', k, counter, len(dict_sqls))
+        progress.event('start', f'..adding table {counter} of {len(dict_sqls)}: {k}')
+        
+        if use_reference_layer(dckCnx, k, ref_db, aoi):
+            progress.event('skip', '....found in the reference database: skip importing',
+                           reason='reference')
+            tables[k]= dckCnx.table(k)
+            counter+= 1
+            continue
+        
+        if aoi is not None:
+            v = aoi.expand_oracle_sql(v)
+            bvars = {**aoi.bind_vars(), **(bvars or {})}
+        
+        # only the bind variables referenced by the query, lists expanded (once)
+        v, qvars, sizes = extract.prepare(v, bvars, types)
+        
+        if journal is not None:
+            fp= fingerprint_sql(v, {**qvars, 'src_crs': src_crs, 'target_crs': target_crs})
+            if simplify and k in simplify:
+                fp= fingerprint_sql(fp, {'tolerance': simplify[k], 'grid_size': grid_size})
+            if journal.is_completed(k, 'load', fp):
+                progress.event('skip', '....completed in a previous run: skip', reason='journal')
+                tables[k]= dckCnx.table(k)
+                counter+= 1
+                continue
+        
+        try:
+            progress.event('extract', '....export from Oracle')
+            batches = extract.iter_prepared(v, qvars, sizes, budget, progress, dtypes)
+            row_count= load_batches_to_duckdb(dckCnx, k, batches, 'ST_GeomFromText', 
+                                              src_crs, target_crs, progress=progress)
+            
+            if simplify and k in simplify:
+                simplify_table(dckCnx, k, simplify[k], grid_size, progress)
+        
+        except Exception as e:
+            progress.failed(e)
+            if journal is not None:
+                journal.mark_failed(k, 'load', fp, e)
+            raise
+        
+        if journal is not None:
+            journal.mark_completed(k, 'load', fp, row_count)
+        progress.done()
+        
+        tables[k] = dckCnx.table(k)
+      
+        counter += 1
+
+    return tables
+
+
+def gdf_to_duckdb (dckCnx, loc_dict, journal=None, simplify=None, grid_size=0.01,
+                   target_crs=None, aoi=None, ref_db=None, budget=None, emit=None):
+    """Insert data from shp/featureclasses into a duckdb table.
+       loc_dict values are either a path or a dict of esri_to_arrow 
+       arguments: {'path':..., 'columns': [...], 'bbox': (...), 'where': '...'}. 
+       Geometries are reprojected from the layer CRS to target_crs.
+       With an AOI, only the features within the AOI are read (pyogrio mask),
+       unless the layer has its own bbox or mask.
+       Tables found in the attached reference database ref_db are not imported.
+       Tables listed in simplify ({table: tolerance}) are simplified after loading.
+       With a memory budget, features are read and inserted in batches 
+       sized to fit it (tables are then always reloaded, unless journaled).
+       Progress events (see dck_helpers.events) are sent to emit (default: printed).
+       Returns lazy duckdb relations of the loaded tables"""
+    tables = {}
+    counter= 1
+    for k, v in loc_dict.items():
+        progress = LoadProgress(emit, 'gdb', k, counter, len(loc_dict))
+        progress.event('start', f'..adding table {counter} of {len(loc_dict)}: {k}')
+        
+        if use_reference_layer(dckCnx, k, ref_db, aoi):
+            progress.event('skip', '....found in the reference database: skip importing',
+                           reason='reference')
+            tables[k]= dckCnx.table(k)
+            counter+= 1
+            continue
+        
+        if isinstance(v, str):
+            v = {'path': v}
+        read_args = {n: x for n, x in v.items() if n != 'path'}
+        if aoi is not None and 'bbox' not in read_args and 'mask' not in read_args:
+            read_args['mask'] = aoi.mask(esri_crs(v['path']))
+        
+        if journal is not None:
+            fp= fingerprint_source(v['path'])
+            if target_crs:
+                fp= fingerprint_sql(fp, {'target_crs': target_crs})
+            if read_args:
+                fp= fingerprint_sql(fp, {n: (x.wkb if n == 'mask' else x) 
+                                         for n, x in read_args.items()})
+            if simplify and k in simplify:
+                fp= fingerprint_sql(fp, {'tolerance': simplify[k], 'grid_size': grid_size})
+            if journal.is_completed(k, 'load', fp):
+                progress.event('skip', '....completed in a previous run: skip', reason='journal')
+                tables[k]= dckCnx.table(k)
+                counter+= 1
+                continue
+        
+        try:
+            progress.event('extract', '....export from gdb')
+            if budget is not None:
+                src_crs= esri_crs(v['path'])
+                batches= iter_esri_arrow(v['path'], budget, progress=progress, **read_args)
+                row_count= load_batches_to_duckdb(dckCnx, k, batches, 'ST_GeomFromWKB', 
+                                                  src_crs, target_crs, progress=progress)
+                loaded= True
+            
+            else:
+                df= esri_to_arrow (v['path'], **read_args)
+                
+                src_crs= df.schema.metadata[b'crs'].decode() or None
+                # the row count and columns don't tell if the table was simplified:
+                # reload it when the journal step changed, or when it is to be simplified
+                force= journal is not None or bool(simplify and k in simplify)
+                loaded= load_df_to_duckdb(dckCnx, k, df, 'ST_GeomFromWKB', src_crs, target_crs,
+                                          progress=progress, force=force)
+                row_count= len(df)
+                # the data now lives in duckdb: drop the arrow copy
+                del df
+            
+            if loaded and simplify and k in simplify:
+                simplify_table(dckCnx, k, simplify[k], grid_size, progress)
+        
+        except Exception as e:
+            progress.failed(e)
+            if journal is not None:
+                journal.mark_failed(k, 'load', fp, e)
+            raise
+        
+        if journal is not None:
+            journal.mark_completed(k, 'load', fp, row_count)
+        # an unchanged table was skipped (no load to measure)
+        if loaded:
+            progress.done(row_count)
+        
+        tables[k] = dckCnx.table(k)
+        
+        counter+= 1
+        
+    return tables
+
+
+def esri_2_duckdb(
+    conn: duckdb.DuckDBPyConnection,
+    fgdb_path: Optional[str] = None,
+    feature_classes: Optional[List[str]] = None,
+    shapefiles: Optional[List[str]] = None,
+    target_crs: Optional[str] = None,
+    aoi: Optional[AOI] = None,
+    ref_db: Optional[str] = None,
+    emit: Optional[Callable[[dict], None]] = None,
+) -> duckdb.DuckDBPyRelation:
+    """
+    Import ESRI vector data into DuckDB as tables, from either an File Geodatabase
+    or standalone Shapefiles. Geometry column is renamed to 'geometry' and an RTREE
+    index is created.
+
+    Args:
+    -----
+      conn : DuckDBPyConnection
+        Active DuckDB connection.
+      fgdb_path : str, optional
+        Filesystem path to the .gdb directory. Required if feature_classes is provided.
+      feature_classes : list of str, optional
+        Names of GDB layers to import. If None and fgdb_path is set, imports all.
+      shapefiles : list of str, optional
+        Full paths to .shp files to import.
+      target_crs : str, optional
+        CRS (e.g 'EPSG:3005') the geometries are reprojected to while importing.
+        The CRS of each table is recorded in the layer_crs table.
+      aoi : AOI, optional
+        Only the features within the AOI are imported (GDAL spatial filter box,
+        then exact intersection).
+      ref_db : str, optional
+        Alias of an attached reference database: layers already there
+        are not imported, a view on them is created instead.
+      emit : callable, optional
+        Receives the progress events of the imports (see dck_helpers.events).
+        By default their messages are printed.
+
+    Returns:
+    ------
+      Lazy DuckDBPyRelation with columns:
+        - table_name
+        - row_count
+        - column_count
+        - geometry_column
+    """
+    import pyogrio
+    
+    tasks = []
+
+    # Prepare GDB layers
+    if fgdb_path:
+        if feature_classes is None:
+            feature_classes = [l[0] for l in pyogrio.list_layers(fgdb_path)]  # all layers in the GDB
+        for lyr in feature_classes:
+            tasks.append({
+                "source": fgdb_path,
+                "driver": "OpenFileGDB",
+                "layer": lyr,
+                "table": lyr,
+            })
+
+    # Prepare Shapefiles
+    if shapefiles:
+        for shp in shapefiles:
+            table_name = Path(shp).stem
+            tasks.append({
+                "source": shp,
+                "driver": "ESRI Shapefile",
+                "layer": None,
+                "table": table_name,
+            })
+
+    total = len(tasks)
+    existing = {r[0] for r in conn.execute("SHOW TABLES").fetchall()}
+
+    for i, task in enumerate(tasks, 1):
+        tbl = task["table"]
+        progress = LoadProgress(emit, 'esri', tbl, i, total)
+        progress.event('start', f"\n[{i}/{total}] Importing '{tbl}'…")
+
+        if use_reference_layer(conn, tbl, ref_db, aoi):
+            progress.event('skip', ' • found in the reference database → skipping',
+                           reason='reference')
+            continue
+
+        # drop if exists (a table, or a view on a reference database)
+        if tbl in existing:
+            progress.event('drop', " • exists → dropping…")
+            drop_layer(conn, tbl)
+
+        # build the ST_Read call
+        read_sql = [
+            f"'{task['source']}'",
+            f"allowed_drivers => ['{task['driver']}']"
+        ]
+        if task["layer"]:
+            read_sql.append(f"layer => '{task['layer']}'")
+
+        # geometry column name and CRS, without reading the features
+        src_crs = pyogrio.read_info(task["source"], layer=task["layer"])["crs"]
+        cols = conn.execute(f"DESCRIBE SELECT * FROM ST_Read({', '.join(read_sql)})").fetchall()
+        geomcol = next(c[0] for c in cols if c[1].upper() == "GEOMETRY")
+
+        # AOI: GDAL spatial filter on the bbox, then exact intersection
+        aoi_filter = ""
+        if aoi is not None:
+            x0, y0, x1, y1 = aoi.bbox(src_crs)
+            read_sql.append(f"spatial_filter_box => ST_MakeBox2D(ST_Point({x0}, {y0}), ST_Point({x1}, {y1}))")
+            quoted_geomcol = f'"{geomcol}"'
+            aoi_filter = f"WHERE {aoi.duckdb_filter(quoted_geomcol, src_crs)}"
+
+        st_read = f"ST_Read({', '.join(read_sql)})"
+
+        # geometry column renamed to geometry, and reprojected
+        geom = geometry_expr(f'"{geomcol}"', src_crs, target_crs)
+        sql = f"""
+            CREATE TABLE "{tbl}" AS
+            SELECT * EXCLUDE ("{geomcol}"), {geom} AS geometry
+            FROM {st_read}
+            {aoi_filter};
+        """
+        progress.event('extract', " • reading into DuckDB…")
+        try:
+            conn.execute(sql)
+            progress.rows = conn.execute(f'SELECT COUNT(*) FROM "{tbl}"').fetchone()[0]
+            progress.event('ingest')
+            record_layer_crs(conn, tbl, src_crs, target_crs, force_2d=False, progress=progress)
+
+            # create spatial index
+            progress.event('index', " • creating RTREE index…")
+            conn.execute(f"""
+                DROP INDEX IF EXISTS idx_geo_{tbl};
+                CREATE INDEX idx_geo_{tbl}
+                  ON "{tbl}" USING RTREE (geometry);
+            """)
+        except Exception as e:
+            progress.failed(e)
+            raise
+        progress.done()
+
+    # stats are computed only when the caller fetches them: exact row counts, 
+    # and only the tables of this database (not those of an attached reference database)
+    imported = [t['table'] for t in tasks if layer_kind(conn, t['table']) == 'TABLE']
+    if not imported:
+        return conn.sql("""SELECT NULL::VARCHAR AS table_name, NULL::BIGINT AS row_count,
+                                  NULL::BIGINT AS column_count, NULL::VARCHAR AS geometry_column
+                           WHERE false""")
+    
+    counts = " UNION ALL ".join(f"""SELECT '{t}' AS table_name, COUNT(*) AS row_count FROM "{t}" """
+                                for t in imported)
+    return conn.sql(f"""
+        SELECT
+            c.table_name,
+            c.row_count,
+            t.column_count,
+            'geometry' AS geometry_column
+        FROM ({counts}) c
+        JOIN duckdb_tables() t
+          ON t.table_name = c.table_name
+         AND t.database_name = current_database()
+        """)
@@ -0,0 +1,79 @@
+"""Memory budget: duckdb memory limit, spilling to disk and batch sizes of the loaders"""
+
+import os
+import re
+from .events import LoadProgress
+
+_units = {'B': 1, 'KB': 1000, 'MB': 1000**2, 'GB': 1000**3, 'TB': 1000**4,
+          'KIB': 1024, 'MIB': 1024**2, 'GIB': 1024**3, 'TIB': 1024**4}
+
+
+def parse_size(size):
+    """Returns the number of bytes of a size given in bytes or as a string (e.g '8GB', '512MiB')"""
+    if isinstance(size, (int, float)):
+        return int(size)
+
+    m = re.fullmatch(r'([\d\.]+)\s*([KMGT]?I?B)', size.strip().upper())
+    if not m:
+        raise Exception(f"Size not recognized: '{size}' (e.g '8GB' or '512MB')")
+
+    return int(float(m.group(1)) * _units[m.group(2)])
+
+
+def row_width(data):
+    """Returns the average width (bytes) of a row of a dataframe or arrow table"""
+    if len(data) == 0:
+        return 0
+
+    if hasattr(data, 'nbytes'):  # arrow table
+        nbytes = data.nbytes
+    else:
+        nbytes = data.memory_usage(index=False, deep=True).sum()
+
+    return nbytes / len(data)
+
+
+class MemoryBudget:
+    """Memory ceiling of a run. It is split between duckdb (memory_limit, spilling
+       to temp_directory beyond it) and the batches held in python by the loaders,
+       the rest being left to python and the readers (GDAL, Oracle client).
+       Concurrent steps (workers) share the batch share"""
+    def __init__(self, limit, temp_directory=None, duckdb_share=0.6, batch_share=0.2,
+                 workers=1, sample_rows=1000, min_rows=1000, max_rows=1000000):
+        self.limit = parse_size(limit)
+        self.temp_directory = temp_directory
+        self.duckdb_share = duckdb_share
+        self.batch_share = batch_share
+        self.workers = max(1, workers)
+        self.sample_rows = sample_rows
+        self.min_rows = min_rows
+        self.max_rows = max_rows
+
+    @property
+    def duckdb_limit(self):
+        return int(self.limit * self.duckdb_share)
+
+    @property
+    def batch_bytes(self):
+        return int(self.limit * self.batch_share / self.workers)
+
+    def configure(self, dckCnx, emit=None):
+        """Sets the duckdb memory limit and the directory it spills to.
+           The budget is sent as an event to emit (default: printed)"""
+        dckCnx.execute(f"SET memory_limit = '{self.duckdb_limit // 1000**2}MB'")
+        if self.temp_directory:
+            os.makedirs(self.temp_directory, exist_ok=True)
+            dckCnx.execute(f"SET temp_directory = '{self.temp_directory}'")
+
+        LoadProgress(emit).event('budget', f'..memory budget {self.limit // 1000**2} MB: '
+                                           f'duckdb {self.duckdb_limit // 1000**2} MB, '
+                                           f'batches {self.batch_bytes // 1000**2} MB per worker',
+                                 limit=self.limit, duckdb_limit=self.duckdb_limit,
+                                 batch_bytes=self.batch_bytes)
+
+    def batch_rows(self, width):
+        """Returns the number of rows of a batch, from the measured width of a row (bytes)"""
+        if not width:
+            return self.max_rows
+
+        return int(max(self.min_rows, min(self.max_rows, self.batch_bytes // width)))
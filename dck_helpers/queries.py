@@ -0,0 +1,84 @@
+"""Duckdb queries, with result shaping compiled into the SQL"""
+
+from .journal import fingerprint_sql
+
+
+def shape_query(sql, distinct=False, distinct_on=None, order_by=None, 
+                group_by=None, aggregates=None, round_digits=None):
+    """Wraps a query with result shaping done inside duckdb:
+         - distinct: drop duplicate rows (SELECT DISTINCT)
+         - distinct_on: keep one row per key columns, the first by order_by (QUALIFY);
+           order_by is required, the row kept would be arbitrary without it
+         - group_by + aggregates: group by key columns, 
+           aggregates is {output column: aggregate expression}
+         - round_digits: {column: digits} rounding applied last"""
+    if distinct:
+        sql = f"SELECT DISTINCT * FROM ({sql})"
+    
+    if distinct_on:
+        if not order_by:
+            raise Exception(f'distinct_on {distinct_on} without order_by: '
+                            'the row kept per key would be arbitrary')
+        keys = ', '.join(distinct_on)
+        order = ', '.join(order_by)
+        sql = f"""SELECT * FROM ({sql}) 
+                  QUALIFY row_number() OVER (PARTITION BY {keys} ORDER BY {order}) = 1"""
+    
+    if group_by:
+        keys = ', '.join(group_by)
+        aggs = ''.join(f', {expr} AS {col}' for col, expr in (aggregates or {}).items())
+        sql = f"SELECT {keys}{aggs} FROM ({sql}) GROUP BY {keys}"
+    
+    if round_digits:
+        cols = ', '.join(f'ROUND({col}, {d}) AS {col}' for col, d in round_digits.items())
+        sql = f"SELECT * REPLACE ({cols}) FROM ({sql})"
+    
+    return sql
+
+
+def run_duckdb_queries (dckCnx, dict_sqls, journal=None, lazy=False, inputs=None):
+    """Run duckdb queries. A query is either a SQL string or a dict of
+       shape_query arguments ({'sql': ..., 'distinct': True, ...}).
+       With a journal, results are persisted in rslt_<query> tables 
+       and reused by the next runs, as long as their inputs are unchanged:
+       the loads and queries listed in inputs ({query: [steps]}), 
+       or all the loads completed so far for a query not listed.
+       With lazy=True, results are returned as duckdb relations 
+       and only fetched when the caller needs them"""
+    results= {}
+    counter = 1
+    inputs = inputs or {}
+    
+    for k, v in dict_sqls.items():
+        print(f'..running query {counter} of {len(dict_sqls)}: {k}')
+        
+        if isinstance(v, dict):
+            v = shape_query(**v)
+        
+        if journal is None:
+            rel= dckCnx.sql(v)
+        
+        else:
+            if k in inputs:
+                input_fps= journal.completed_fingerprints(['load', 'query'], sorted(inputs[k]))
+            else:
+                input_fps= journal.completed_fingerprints('load')
+            fp= fingerprint_sql(v, {'inputs': input_fps})
+            if journal.is_completed(k, 'query', fp):
+                print ('....completed in a previous run: skip')
+            else:
+                try:
+                    dckCnx.execute(f'CREATE OR REPLACE TABLE rslt_{k} AS {v}')
+                except Exception as e:
+                    journal.mark_failed(k, 'query', fp, e)
+                    raise
+                row_count= dckCnx.execute(f'SELECT COUNT(*) FROM rslt_{k}').fetchone()[0]
+                journal.mark_completed(k, 'query', fp, row_count)
+            
+            rel= dckCnx.table(f'rslt_{k}')
+        
+        results[k]= rel if lazy else rel.df()
+        
+        counter+= 1
+        
+    return results
@@ -0,0 +1,230 @@
+"""Readers of Oracle query results and ESRI vectors (shp, featureclass/gdb)"""
+
+import os
+from .events import LoadProgress
+from .memory import row_width
+
+
+def read_query(connection,cursor,query,bvars):
+    "Returns a df containing SQL Query results"
+    import pandas as pd
+    
+    cursor.execute(query, bvars)
+    names = [x[0] for x in cursor.description]
+    rows = cursor.fetchall()
+    df = pd.DataFrame(rows, columns=names)
+    
+    return df
+
+
+def oracle_dtypes(description):
+    """Returns the dataframe dtypes of the columns of an Oracle query, from the 
+       declared types of cursor.description, so that every batch has the same types 
+       in duckdb whatever its values (e.g a NUMBER column all integral or all null
+       in the first batch). Unconstrained NUMBER columns are float64: see 
+       unconstrained_numbers"""
+    import cx_Oracle
+    
+    dtypes = {}
+    for name, typ, _, _, precision, scale, _ in description:
+        if typ in (cx_Oracle.STRING, cx_Oracle.FIXED_CHAR, 
+                   cx_Oracle.DB_TYPE_CLOB, cx_Oracle.DB_TYPE_NCLOB):
+            dtypes[name] = 'string'
+        elif typ == cx_Oracle.NUMBER:
+            # NUMBER(p, 0) is an integer, NUMBER and NUMBER(p, s) may hold decimals
+            dtypes[name] = 'Int64' if precision and scale == 0 else 'float64'
+        elif typ == cx_Oracle.DATETIME:
+            dtypes[name] = 'datetime64[us]'
+    
+    return dtypes
+
+
+def unconstrained_numbers(description):
+    """Returns the names of the NUMBER columns of an Oracle query declared without 
+       precision and scale (precision 0, scale -127), e.g IDs or computed columns: 
+       integers or decimals, only told apart by their values"""
+    import cx_Oracle
+    
+    return [name for name, typ, _, _, precision, scale, _ in description
+            if typ == cx_Oracle.NUMBER and not precision and scale == -127]
+
+
+def is_integral(values):
+    """Returns True if a column of numbers (or nulls) only holds integers"""
+    import pandas as pd
+    
+    numbers = pd.to_numeric(values, errors='coerce').dropna()
+    
+    return bool((numbers % 1 == 0).all())
+
+
+def iter_query(cursor, query, bvars, budget=None, arraysize=10000, progress=None,
+               dtypes=None):
+    """Yields the results of an Oracle query as dataframes of arraysize rows,
+       typed from the declared column types (see oracle_dtypes), or from dtypes 
+       ({column: dtype}). Unconstrained NUMBER columns are Int64 if the first batch
+       only holds integers, and float64 from the first batch holding decimals
+       (see load_batches_to_duckdb).
+       With a memory budget, the batch size is set from the width of 
+       the first rows, to fit the batch share of the budget. 
+       Rows are fetched arraysize at a time in both cases.
+       The batch size is sent to progress (LoadProgress).
+       The first batch is always yielded, even if empty"""
+    import pandas as pd
+    
+    progress = progress or LoadProgress()
+    
+    # rows per round trip
+    cursor.arraysize = arraysize
+    cursor.execute(query, bvars)
+    names = [x[0] for x in cursor.description]
+    numbers = [n for n in unconstrained_numbers(cursor.description) if n not in (dtypes or {})]
+    dtypes = {**oracle_dtypes(cursor.description), **(dtypes or {})}
+    
+    def typed(rows):
+        df = pd.DataFrame(rows, columns=names)
+        for n in numbers:
+            if dtypes[n] != 'float64' and not is_integral(df[n]):
+                progress.event('widen', f'....{n}: decimal values, loaded as DOUBLE', column=n)
+                dtypes[n] = 'float64'
+        return df.astype(dtypes)
+    
+    for n in numbers:
+        dtypes[n] = 'Int64'
+    
+    batch_rows = budget.sample_rows if budget is not None else arraysize
+    df = typed(cursor.fetchmany(batch_rows))
+    if budget is not None:
+        batch_rows = budget.batch_rows(row_width(df))
+        progress.event('batch_size', f'....fetching batches of {batch_rows} rows', 
+                       batch_rows=batch_rows)
+    
+    yield df
+    del df
+    
+    while True:
+        rows = cursor.fetchmany(batch_rows)
+        if not rows:
+            break
+        yield typed(rows)
+        del rows
+
+
+def esri_to_gdf (aoi):
+    """Returns a Geopandas file (gdf) based on 
+       an ESRI format vector (shp or featureclass/gdb)"""
+    import geopandas as gpd
+    
+    if '.shp' in aoi: 
+        gdf = gpd.read_file(aoi)
+    
+    elif '.gdb' in aoi:
+        l = aoi.split ('.gdb')
+        gdb = l[0] + '.gdb'
+        fc = os.path.basename(aoi)
+        gdf = gpd.read_file(filename= gdb, layer= fc)
+        
+    else:
+        raise Exception ('Format not recognized. Please provide a shp or featureclass (gdb)!')
+    
+    return gdf
+
+
+def split_esri_path (aoi):
+    """Returns the dataset path and layer name of a shp or featureclass (gdb)"""
+    if '.shp' in aoi: 
+        return aoi, None
+    
+    elif '.gdb' in aoi:
+        l = aoi.split ('.gdb')
+        return l[0] + '.gdb', os.path.basename(aoi)
+        
+    raise Exception ('Format not recognized. Please provide a shp or featureclass (gdb)!')
+
+
+def esri_crs (aoi):
+    """Returns the CRS of a shp or featureclass (gdb), without reading the features"""
+    import pyogrio
+    
+    path, layer = split_esri_path(aoi)
+    
+    return pyogrio.read_info(path, layer=layer)['crs']
+
+
+def esri_to_arrow (aoi, columns=None, bbox=None, mask=None, where=None, force_2d=False,
+                   max_features=None):
+    """Returns an Arrow table based on an ESRI format vector (shp or featureclass/gdb).
+       Only the listed columns and the features intersecting the bbox/mask 
+       and matching the where clause are read. Geometries are returned 
+       as WKB in a GEOMETRY column, the layer CRS in the 'crs' schema metadata"""
+    import pyogrio
+    
+    path, layer = split_esri_path(aoi)
+    
+    meta, table = pyogrio.read_arrow(path, layer=layer, columns=columns, bbox=bbox,
+                                     mask=mask, where=where, force_2d=force_2d,
+                                     max_features=max_features)
+    
+    return plain_geometry(table, meta)
+
+
+def iter_esri_arrow (aoi, budget, columns=None, bbox=None, mask=None, where=None, 
+                     force_2d=False, progress=None):
+    """Yields an ESRI format vector as Arrow tables of bounded size (see esri_to_arrow).
+       The batch size is set from the width of a sample of the features, to fit 
+       the batch share of the memory budget, and sent to progress (LoadProgress).
+       The first batch is always yielded, even if empty"""
+    import pyogrio
+    import pyarrow as pa
+    
+    progress = progress or LoadProgress()
+    
+    read_args = dict(columns=columns, bbox=bbox, mask=mask, where=where, force_2d=force_2d)
+    sample = esri_to_arrow(aoi, max_features=budget.sample_rows, **read_args)
+    
+    # small layer: the sample holds all the features
+    if sample.num_rows < budget.sample_rows:
+        yield sample
+        return
+    
+    batch_rows = budget.batch_rows(row_width(sample))
+    del sample
+    progress.event('batch_size', f'....reading batches of {batch_rows} features', 
+                   batch_rows=batch_rows)
+    
+    path, layer = split_esri_path(aoi)
+    with pyogrio.open_arrow(path, layer=layer, batch_size=batch_rows, 
+                            use_pyarrow=True, **read_args) as source:
+        meta, reader = source
+        for batch in reader:
+            yield plain_geometry(pa.Table.from_batches([batch]), meta)
+
+
+def plain_geometry(table, meta):
+    """Returns an Arrow table read by pyogrio with its geometry as a plain WKB 
+       GEOMETRY column, and the layer CRS in the 'crs' schema metadata"""
+    import pyarrow as pa
+    
+    geom_name = meta['geometry_name'] or 'wkb_geometry'
+    geom_idx = table.schema.get_field_index(geom_name)
+    geom = table.column(geom_idx)
+    if isinstance(geom.type, pa.ExtensionType):
+        geom = geom.cast(geom.type.storage_type)
+    
+    # plain binary column, without the geoarrow field metadata
+    table = table.set_column(geom_idx, pa.field('GEOMETRY', geom.type), geom)
+    table = table.replace_schema_metadata({'crs': meta['crs'] or ''})
+    
+    return table
+
+ 
+def get_wkb_srid(gdf):
+    """Returns SRID and WKB objects from gdf"""
+    from shapely import wkb
+    
+    srid = gdf.crs.to_epsg()
+    geom = gdf['geometry'].iloc[0]
+
+    wkb_aoi = wkb.dumps(geom, output_dimension=2)
+        
+    return wkb_aoi, srid
@@ -0,0 +1,45 @@
+"""Shared read-only reference database of curated layers"""
+
+import duckdb
+from .catalog import table_exists, drop_layer, get_layer_crs
+
+
+def attach_reference_db(dckCnx, path, alias='ref'):
+    """Attaches a shared reference database in read-only mode. 
+       Loaders given ref_db=alias query its layers in place instead of importing them"""
+    dckCnx.execute(f"ATTACH IF NOT EXISTS '{path}' AS {alias} (READ_ONLY)")
+
+
+def use_reference_layer(dckCnx, table, ref_db, aoi=None):
+    """Creates a view of a layer of the reference database, filtered by the AOI if any.
+       Returns False if the layer is not in the reference database 
+       (the loaders report the skipped import)"""
+    if ref_db is None or not table_exists(dckCnx, table, ref_db):
+        return False
+    
+    where = ''
+    if aoi is not None:
+        where = f"WHERE {aoi.duckdb_filter('geometry', get_layer_crs(dckCnx, table, ref_db))}"
+    
+    # the layer may have been imported in a previous run
+    drop_layer(dckCnx, table, 'TABLE')
+    dckCnx.execute(f'CREATE OR REPLACE VIEW {table} AS SELECT * FROM {ref_db}.{table} {where}')
+    
+    return True
+
+
+def build_reference_db(path, fgdb_path=None, feature_classes=None, shapefiles=None, 
+                       target_crs=None):
+    """Builds (or updates) a curated reference database: layers are imported 
+       with their CRS recorded and an RTREE index, to be attached by the jobs"""
+    from .loaders import esri_2_duckdb
+    
+    conn = duckdb.connect(path)
+    conn.install_extension('spatial')
+    conn.load_extension('spatial')
+    try:
+        stats = esri_2_duckdb(conn, fgdb_path, feature_classes, shapefiles, target_crs).df()
+    finally:
+        conn.close()
+    
+    return stats
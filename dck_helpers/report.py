@@ -0,0 +1,34 @@
+"""Excel reports of the query results"""
+
+import os
+import duckdb
+
+
+def generate_report (workspace, df_list, sheet_list,filename):
+    """ Exports dataframes (or duckdb relations) to multi-tab excel spreasheet"""
+    import pandas as pd
+    
+    outfile= os.path.join(workspace, filename + '.xlsx')
+
+    with pd.ExcelWriter(outfile, engine='xlsxwriter') as writer:
+        for dataframe, sheet in zip(df_list, sheet_list):
+            if isinstance(dataframe, duckdb.DuckDBPyRelation):
+                dataframe = dataframe.df()
+            dataframe = dataframe.reset_index(drop=True)
+            dataframe.index = dataframe.index + 1
+
+            dataframe.to_excel(writer, sheet_name=sheet, index=False, startrow=0 , startcol=0)
+
+            worksheet = writer.sheets[sheet]
+            #workbook = writer.book
+
+            worksheet.set_column(0, dataframe.shape[1], 25)
+
+            col_names = [{'header': col_name} for col_name in dataframe.columns[1:-1]]
+            col_names.insert(0,{'header' : dataframe.columns[0], 'total_string': 'Total'})
+            col_names.append ({'header' : dataframe.columns[-1], 'total_function': 'sum'})
+
+
+            worksheet.add_table(0, 0, dataframe.shape[0]+1, dataframe.shape[1]-1, {
+                'total_row': True,
+                'columns': col_names})
@@ -0,0 +1,272 @@
+"""
+Grid-tiled spatial join for very large polygon-on-polygon overlays.
+
+Both layers are assigned to tiles (regular grid or quadtree) by bounding box,
+and the join runs per tile in worker processes, each with its own read-only
+connection to the duckdb file. A pair found in several tiles is only kept in
+the tile containing its reference point: the lower-left corner of the
+intersection of the two bounding boxes.
+
+Job query steps with a `tiled` option run through run_tiled_query, which closes
+the read-write connection of the job while the workers read the file.
+"""
+
+import os
+import math
+import duckdb
+from concurrent.futures import ProcessPoolExecutor
+
+
+def connect_read_only(db, attach=None):
+    """Connects to a duckdb file in read-only mode and loads the spatial extension.
+       The databases of attach ({alias: path}, e.g a reference database) are attached"""
+    conn = duckdb.connect(db, read_only=True)
+    conn.load_extension('spatial')
+    for alias, path in (attach or {}).items():
+        conn.execute(f"ATTACH '{path}' AS {alias} (READ_ONLY)")
+
+    return conn
+
+
+def join_sql(left, right, select, left_alias='l', right_alias='r'):
+    """Returns the SQL of the (untiled) join of two tables, equivalent to the tiled join"""
+    la, ra = left_alias, right_alias
+
+    return f"""
+        SELECT {select}
+        FROM {left} {la}
+        JOIN {right} {ra}
+            ON ST_Intersects({la}.geometry, {ra}.geometry)
+        """
+
+
+def get_extent(conn, tables):
+    """Returns the extent (xmin, ymin, xmax, ymax) of a list of tables"""
+    sql = " UNION ALL ".join(f"""SELECT MIN(ST_XMin(geometry)) AS xmin, MIN(ST_YMin(geometry)) AS ymin,
+                                        MAX(ST_XMax(geometry)) AS xmax, MAX(ST_YMax(geometry)) AS ymax
+                                 FROM {t}""" for t in tables)
+
+    return conn.execute(f"""SELECT MIN(xmin), MIN(ymin), MAX(xmax), MAX(ymax)
+                            FROM ({sql})""").fetchone()
+
+
+def make_grid_tiles(extent, tile_size):
+    """Returns the tiles of a regular grid covering the extent.
+       A tile is (xmin, ymin, xmax, ymax, closed_x, closed_y): its upper bounds
+       are only inclusive on the last column/row (closed_x/closed_y)"""
+    xmin, ymin, xmax, ymax = extent
+    nx = max(1, math.ceil((xmax - xmin) / tile_size))
+    ny = max(1, math.ceil((ymax - ymin) / tile_size))
+
+    # shared edges: adjacent tiles use the exact same bound values
+    xs = [xmin + i * tile_size for i in range(nx)] + [xmax]
+    ys = [ymin + j * tile_size for j in range(ny)] + [ymax]
+
+    tiles = []
+    for i in range(nx):
+        for j in range(ny):
+            tiles.append((xs[i], ys[j], xs[i+1], ys[j+1], i == nx - 1, j == ny - 1))
+
+    return tiles
+
+
+def feature_bounds(conn, tables):
+    """Returns the bounds (n, 4: xmin, ymin, xmax, ymax) of the features of the tables,
+       read in a single pass"""
+    import numpy as np
+
+    sql = " UNION ALL ".join(f"""SELECT ST_XMin(geometry) AS xmin, ST_YMin(geometry) AS ymin,
+                                        ST_XMax(geometry) AS xmax, ST_YMax(geometry) AS ymax
+                                 FROM {t} WHERE geometry IS NOT NULL""" for t in tables)
+    cols = conn.execute(sql).fetchnumpy()
+
+    return np.column_stack([cols[c] for c in ('xmin', 'ymin', 'xmax', 'ymax')]).astype(float)
+
+
+def make_quadtree_tiles(bounds, extent, max_features, max_depth=8):
+    """Returns the leaves of a quadtree covering the extent: a tile is split
+       in 4 until it holds less than max_features features (or max_depth is reached).
+       Features are counted from their bounds (see feature_bounds): a child tile
+       only tests the features of its parent"""
+    xmin, ymin, xmax, ymax = extent
+    tiles = []
+    stack = [((xmin, ymin, xmax, ymax, True, True), 0, bounds)]
+
+    while stack:
+        tile, depth, inside = stack.pop()
+        if depth >= max_depth or len(inside) <= max_features:
+            tiles.append(tile)
+            continue
+
+        x0, y0, x1, y1, closed_x, closed_y = tile
+        xm = (x0 + x1) / 2
+        ym = (y0 + y1) / 2
+        for child in ((x0, y0, xm, ym, False, False),
+                      (xm, y0, x1, ym, closed_x, False),
+                      (x0, ym, xm, y1, False, closed_y),
+                      (xm, ym, x1, y1, closed_x, closed_y)):
+            # bbox intersection, as ST_Intersects_Extent
+            mask = ((inside[:, 0] <= child[2]) & (inside[:, 2] >= child[0]) &
+                    (inside[:, 1] <= child[3]) & (inside[:, 3] >= child[1]))
+            stack.append((child, depth + 1, inside[mask]))
+
+    return tiles
+
+
+def tile_join_sql(left, right, select, tile, left_alias='l', right_alias='r'):
+    """Returns the SQL joining the features of two tables within a tile.
+       Only the pairs whose reference point falls in the tile are kept"""
+    x0, y0, x1, y1, closed_x, closed_y = tile
+    env = f'ST_MakeEnvelope({x0}, {y0}, {x1}, {y1})'
+    x_op = '<=' if closed_x else '<'
+    y_op = '<=' if closed_y else '<'
+    la, ra = left_alias, right_alias
+
+    return f"""
+        WITH
+            {la} AS (SELECT * FROM {left} WHERE ST_Intersects_Extent(geometry, {env})),
+            {ra} AS (SELECT * FROM {right} WHERE ST_Intersects_Extent(geometry, {env}))
+        SELECT {select}
+        FROM {la}
+        JOIN {ra}
+            ON ST_Intersects({la}.geometry, {ra}.geometry)
+        WHERE GREATEST(ST_XMin({la}.geometry), ST_XMin({ra}.geometry)) >= {x0}
+            AND GREATEST(ST_XMin({la}.geometry), ST_XMin({ra}.geometry)) {x_op} {x1}
+            AND GREATEST(ST_YMin({la}.geometry), ST_YMin({ra}.geometry)) >= {y0}
+            AND GREATEST(ST_YMin({la}.geometry), ST_YMin({ra}.geometry)) {y_op} {y1}
+        """
+
+
+_worker_conn = None
+
+def _init_worker(db, attach):
+    """Opens one read-only connection per worker process"""
+    global _worker_conn
+    _worker_conn = connect_read_only(db, attach)
+
+
+def _join_tile(sql):
+    return _worker_conn.execute(sql).fetch_arrow_table()
+
+
+def tiled_spatial_join(db, left, right, select, left_alias='l', right_alias='r',
+                       tile_size=None, max_features=None, workers=None, attach=None):
+    """
+    Joins two spatial tables of a duckdb file (ST_Intersects) tile by tile,
+    across worker processes.
+
+    Args:
+    -----
+      db : str
+        Path to the duckdb file. It must not be open in read-write mode
+        by another connection while the join runs.
+      left, right : str
+        Names of the tables to join (geometry column: geometry).
+      select : str
+        Select list of the join, using left_alias and right_alias.
+      tile_size : float, optional
+        Size of the regular grid tiles (in CRS units).
+      max_features : int, optional
+        Use a quadtree instead of a regular grid: tiles are split until
+        they hold less than max_features features.
+      workers : int, optional
+        Number of worker processes (default: number of cores).
+      attach : dict, optional
+        Databases ({alias: path}) attached read-only by the connections,
+        e.g the reference database of views on reference layers.
+
+    Returns:
+    ------
+      pyarrow.Table of the join results
+    """
+    conn = connect_read_only(db, attach)
+    try:
+        extent = get_extent(conn, [left, right])
+        if extent[0] is None:
+            return conn.execute(tile_join_sql(left, right, select, (0, 0, 0, 0, True, True),
+                                              left_alias, right_alias)).fetch_arrow_table()
+
+        if max_features:
+            tiles = make_quadtree_tiles(feature_bounds(conn, [left, right]), extent, max_features)
+        else:
+            if tile_size is None:
+                # default: about 4 tiles per worker
+                n = math.ceil(math.sqrt(4 * (workers or os.cpu_count())))
+                tile_size = max(extent[2] - extent[0], extent[3] - extent[1]) / n or 1
+            tiles = make_grid_tiles(extent, tile_size)
+    finally:
+        conn.close()
+
+    import pyarrow as pa
+    
+    print(f'..joining {left} and {right} over {len(tiles)} tiles')
+    sqls = [tile_join_sql(left, right, select, t, left_alias, right_alias) for t in tiles]
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(db, attach)) as executor:
+        parts = list(executor.map(_join_tile, sqls))
+
+    return pa.concat_tables(parts)
+
+
+
+def run_tiled_query(connector, name, tiled, select, shaping=None, attach=None, journal_name=None,
+                    inputs=None):
+    """Runs a tiled join (see tiled_spatial_join) into the rslt_<name> table of the
+       database of a DuckDBConnector. tiled holds the join arguments: left, right,
+       left_alias, right_alias and tile_size or max_features (and workers).
+       The workers can't open the file while the connector holds a read-write
+       connection: it is checkpointed and closed during the join, then reopened
+       (the caller must not use the connection meanwhile).
+       Result shaping (see shape_query) is applied to the joined rows.
+       With a journal name, the result is reused by the next runs, as in run_duckdb_queries"""
+    from .journal import RunJournal, fingerprint_sql
+    from .queries import shape_query
+    from .reference import attach_reference_db
+
+    tiled = dict(tiled)
+    join = {n: tiled.pop(n) for n in ('left', 'right', 'left_alias', 'right_alias') if n in tiled}
+    sql = shape_query(join_sql(select=select, **join), **(shaping or {}))
+    print(f'..running tiled query: {name}')
+
+    journal = None
+    if journal_name is not None:
+        journal = RunJournal(connector.conn, run_name=journal_name)
+        input_fps = journal.completed_fingerprints(['load', 'query'], sorted(inputs or []))
+        fp = fingerprint_sql(sql, {'inputs': input_fps})
+        if journal.is_completed(name, 'query', fp):
+            print('....completed in a previous run: skip')
+            return connector.conn.table(f'rslt_{name}')
+
+    try:
+        if connector.db == ':memory:':
+            # an in-memory database can't be shared with worker processes
+            connector.conn.execute(f'CREATE OR REPLACE TABLE rslt_{name} AS {sql}')
+        else:
+            connector.conn.execute('CHECKPOINT')
+            connector.disconnect_db()
+            try:
+                joined = tiled_spatial_join(connector.db, select=select, attach=attach,
+                                            **join, **tiled)
+            finally:
+                connector.connect_to_db()
+                for alias, path in (attach or {}).items():
+                    attach_reference_db(connector.conn, path, alias)
+            connector.conn.register(f'joined_{name}', joined)
+            try:
+                shaped = shape_query(f'SELECT * FROM joined_{name}', **(shaping or {}))
+                connector.conn.execute(f'CREATE OR REPLACE TABLE rslt_{name} AS {shaped}')
+            finally:
+                connector.conn.unregister(f'joined_{name}')
+
+    except Exception as e:
+        if journal is not None:
+            RunJournal(connector.conn, run_name=journal_name).mark_failed(name, 'query', fp, e)
+        raise
+
+    if journal is not None:
+        row_count = connector.conn.execute(f'SELECT COUNT(*) FROM rslt_{name}').fetchone()[0]
+        RunJournal(connector.conn, run_name=journal_name).mark_completed(name, 'query', fp,
+                                                                          row_count)
+
+    return connector.conn.table(f'rslt_{name}')
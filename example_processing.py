@@ -1,68 +1,7 @@
-import warnings
-warnings.simplefilter(action='ignore')
-
 import os
-import json
 import timeit
-import duckdb
-import cx_Oracle
-import pandas as pd
-import geopandas as gpd
-from shapely import wkb
-
-class OracleConnector:
-    def __init__(self, dbname='BCGW'):
-        self.dbname = dbname
-        self.cnxinfo = self.get_db_cnxinfo()
-
-    def get_db_cnxinfo(self):
-        """ Retrieves db connection params from the config file"""
-        with open(r'H:\config\db_config.json', 'r') as file:
-            data = json.load(file)
-        
-        if self.dbname in data:
-            return data[self.dbname]
-        
-        raise KeyError(f"Database '{self.dbname}' not found.")
-    
-    def connect_to_db(self):
-        """ Connects to Oracle DB and create a cursor"""
-        try:
-            self.connection = cx_Oracle.connect(self.cnxinfo['username'], 
-                                                self.cnxinfo['password'], 
-                                                self.cnxinfo['hostname'], 
-                                                encoding="UTF-8")
-            self.cursor = self.connection.cursor()
-            print  ("..Successffuly connected to the database")
-        except Exception as e:
-            raise Exception(f'..Connection failed: {e}')
-
-    def disconnect_db(self):
-        """Close the Oracle connection and cursor"""
-        if hasattr(self, 'cursor') and self.cursor:
-            self.cursor.close()
-        if hasattr(self, 'connection') and self.connection:
-            self.connection.close()
-            print("....Disconnected from the database")
-
-
-class DuckDBConnector:
-    def __init__(self, db=':memory:'):
-        self.db = db
-        self.conn = None
-    
-    def connect_to_db(self):
-        """Connects to a DuckDB database and installs spatial extension."""
-        self.conn = duckdb.connect(self.db)
-        self.conn.install_extension('spatial')
-        self.conn.load_extension('spatial')
-        return self.conn
-    
-    def disconnect_db(self):
-        """Disconnects from the DuckDB database."""
-        if self.conn is not None:
-            self.conn.close()
-            self.conn = None
+from dck_helpers import (OracleConnector, DuckDBConnector, RunJournal, MemoryBudget, OracleExtract,
+                         gdf_to_duckdb, oracle_2_duckdb, run_duckdb_queries, attach_reference_db)
 
 
 def get_wshd_list(orcCnx):
@@ -77,13 +16,13 @@ def get_wshd_list(orcCnx):
                     AND wha.WHA_TAG IN ('4-282', '4-287', '4-283', '4-312', '4-281', 
                                 '4-288', '4-307', '4-286', '4-284', '4-285', '4-306') 
         """
-    df= pd.read_sql(sql, orcCnx) 
-    wshd_lst= ",".join(str(x) for x in df['WATERSHED_FEATURE_ID'].to_list())
+    df= OracleExtract(orcCnx).read_df(sql)
+    wshd_ids= df['WATERSHED_FEATURE_ID'].to_list()
       
-    return wshd_lst 
+    return wshd_ids 
 
     
-def load_Orc_sql(wshd_lst):
+def load_Orc_sql():
     orSql= {}
     
     
@@ -99,17 +38,17 @@ def load_Orc_sql(wshd_lst):
                         '4-288', '4-307', '4-286', '4-284', '4-285', '4-306')
         """
 
-    orSql['watersheds']=f"""
+    orSql['watersheds']="""
         SELECT
             wsh.WATERSHED_FEATURE_ID,
             SDO_UTIL.TO_WKTGEOMETRY(wsh.GEOMETRY) AS GEOMETRY
         FROM 
             WHSE_BASEMAPPING.FWA_ASSESSMENT_WATERSHEDS_POLY wsh
         WHERE        
-            wsh.WATERSHED_FEATURE_ID IN ({wshd_lst})
+            wsh.WATERSHED_FEATURE_ID IN (:wshd_ids)
             """
             
-    orSql['harvested_ctb']=f"""
+    orSql['harvested_ctb']="""
         SELECT
             ctb.VEG_CONSOLIDATED_CUT_BLOCK_ID,
             ctb.HARVEST_YEAR,
@@ -121,12 +60,12 @@ def load_Orc_sql(wshd_lst):
             AND SDO_ANYINTERACT (ctb.SHAPE, 
                                  (SELECT SDO_AGGR_UNION(SDOAGGRTYPE(wsh.GEOMETRY, 1)) AS geom
                                   FROM WHSE_BASEMAPPING.FWA_ASSESSMENT_WATERSHEDS_POLY wsh 
-                                  WHERE wsh.WATERSHED_FEATURE_ID IN ({wshd_lst})
+                                  WHERE wsh.WATERSHED_FEATURE_ID IN (:wshd_ids)
                                       )
                                          ) = 'TRUE'
         """
         
-    orSql['approved_ctb']=f"""
+    orSql['approved_ctb']="""
         SELECT
             frs.MAP_LABEL,
             SDO_UTIL.TO_WKTGEOMETRY(frs.GEOMETRY) AS GEOMETRY
@@ -137,12 +76,12 @@ def load_Orc_sql(wshd_lst):
             AND SDO_ANYINTERACT (frs.GEOMETRY, 
                                  (SELECT SDO_AGGR_UNION(SDOAGGRTYPE(wsh.GEOMETRY, 1)) AS geom
                                   FROM WHSE_BASEMAPPING.FWA_ASSESSMENT_WATERSHEDS_POLY wsh 
-                                  WHERE wsh.WATERSHED_FEATURE_ID IN ({wshd_lst})
+                                  WHERE wsh.WATERSHED_FEATURE_ID IN (:wshd_ids)
                                       )
                                          ) = 'TRUE'
         """
         
-    orSql['streams']=f"""
+    orSql['streams']="""
         SELECT
             str.LINEAR_FEATURE_ID,
             SDO_UTIL.TO_WKTGEOMETRY(SDO_CS.MAKE_2D(str.GEOMETRY)) AS GEOMETRY
@@ -152,7 +91,7 @@ def load_Orc_sql(wshd_lst):
             SDO_ANYINTERACT (str.GEOMETRY, 
                                  (SELECT SDO_AGGR_UNION(SDOAGGRTYPE(wsh.GEOMETRY, 1)) AS geom
                                   FROM WHSE_BASEMAPPING.FWA_ASSESSMENT_WATERSHEDS_POLY wsh 
-                                  WHERE wsh.WATERSHED_FEATURE_ID IN ({wshd_lst})
+                                  WHERE wsh.WATERSHED_FEATURE_ID IN (:wshd_ids)
                                       )
                                          ) = 'TRUE' 
         """            
@@ -264,138 +203,10 @@ def load_dck_sql():
     return dkSql    
 
 
-def esri_to_gdf (aoi):
-    """Returns a Geopandas file (gdf) based on 
-       an ESRI format vector (shp or featureclass/gdb)"""
-    
-    if '.shp' in aoi: 
-        gdf = gpd.read_file(aoi)
-    
-    elif '.gdb' in aoi:
-        l = aoi.split ('.gdb')
-        gdb = l[0] + '.gdb'
-        fc = os.path.basename(aoi)
-        gdf = gpd.read_file(filename= gdb, layer= fc)
-        
-    else:
-        raise Exception ('Format not recognized. Please provide a shp or featureclass (gdb)!')
-    
-    return gdf
-
-
-def gdf_to_duckdb (dckCnx, loc_dict):
-    """Insert data from a gdfs into a duckdb table """
-    tables = {}
-    counter= 1
-    for k, v in loc_dict.items():
-        print (f'..adding table {counter} of {len(loc_dict)}: {k}')
-        print ('....export from gdb')
-        df= esri_to_gdf (v)
-        df['GEOMETRY']= df['geometry'].apply(lambda x: wkb.dumps(x, output_dimension=2))
-        df = df.drop(columns=['geometry'])
-        
-        dck_tab_list= dckCnx.execute('SHOW TABLES').df()['name'].to_list()
-        
-        if k in dck_tab_list:
-            dck_row_count= dckCnx.execute(f'SELECT COUNT(*) FROM {k}').fetchone()[0]
-            dck_col_nams= dckCnx.execute(f"""SELECT column_name 
-                                             FROM INFORMATION_SCHEMA.COLUMNS 
-                                             WHERE table_name = '{k}'""").df()['column_name'].to_list()
-                
-            if (dck_row_count != len(df)) or (set(list(df.columns)) != set(dck_col_nams)):
-                print ('....import to Duckdb')
-                create_table_query = f"""
-                CREATE OR REPLACE TABLE {k} AS
-                  SELECT * EXCLUDE geometry, ST_GeomFromWKB(geometry) AS GEOMETRY
-                  FROM df;
-                """
-                dckCnx.execute(create_table_query)
-            else:
-                print('....data already in db: skip importing')
-                pass
-        
-        else:
-            print ('....import to Duckdb')
-            create_table_query = f"""
-            CREATE OR REPLACE TABLE {k} AS
-              SELECT * EXCLUDE geometry, ST_GeomFromWKB(geometry) AS GEOMETRY
-              FROM df;
-            """
-            dckCnx.execute(create_table_query)
-            
-        
-        df = df.drop(columns=['GEOMETRY'])
-        
-        tables[k] = df
-        
-        counter+= 1
-        
-        return tables
-        
-        
-def oracle_2_duckdb(orcCnx, dckCnx, dict_sqls):
-    """Insert data from Oracle into a duckdb table"""
-    tables = {}
-    counter = 1
-    
-    for k, v in dict_sqls.items():
-        print(f'..adding table {counter} of {len(dict_sqls)}: {k}')
-        print('....export from Oracle')
-        df = pd.read_sql(v, orcCnx)
-
-        dck_tab_list= dckCnx.execute('SHOW TABLES').df()['name'].to_list()
-        
-        if k in dck_tab_list:
-            dck_row_count= dckCnx.execute(f'SELECT COUNT(*) FROM {k}').fetchone()[0]
-            dck_col_nams= dckCnx.execute(f"""SELECT column_name 
-                                             FROM INFORMATION_SCHEMA.COLUMNS 
-                                             WHERE table_name = '{k}'""").df()['column_name'].to_list()
-                
-            if (dck_row_count != len(df)) or (set(list(df.columns)) != set(dck_col_nams)):
-                print ('....import to Duckdb')
-                create_table_query = f"""
-                CREATE OR REPLACE TABLE {k} AS
-                  SELECT * EXCLUDE geometry, ST_GeomFromText(geometry) AS GEOMETRY
-                  FROM df;
-                """
-                dckCnx.execute(create_table_query)
-            else:
-                print('....data already in db: skip importing')
-                pass
-        
-        else:
-            print ('....import to Duckdb')
-            create_table_query = f"""
-            CREATE OR REPLACE TABLE {k} AS
-              SELECT * EXCLUDE geometry, ST_GeomFromText(geometry) AS GEOMETRY
-              FROM df;
-            """
-            dckCnx.execute(create_table_query)
-      
-        df = df.drop(columns=['GEOMETRY'])
-        
-        tables[k] = df
-      
-        counter += 1
-
-    return tables
-
-
-def run_duckdb_queries (dckCnx, dict_sqls):
-    """Run duckdb queries """
-    results= {}
-    counter = 1
-    for k, v in dict_sqls.items():
-        counter = 1
-        print(f'..running query {counter} of {len(dict_sqls)}: {k}')
-        results[k]= dckCnx.execute(v).df()
-        
-        counter+= 1
-        
-    return results
-
-
 if __name__ == "__main__":
+    import warnings
+    warnings.simplefilter(action='ignore')
+    
     start_t = timeit.default_timer() #start time
     
     wks=r'\\spatialfiles.bcgov\Work\lwbc\visr\Workarea\moez_labiadh\WORKSPACE_2024\tempo\20240318'
@@ -405,32 +216,48 @@ if __name__ == "__main__":
     Oracle.connect_to_db()
     orcCnx= Oracle.connection
     
+    # Memory ceiling: duckdb spills to disk and the loads are done in batches
+    budget= MemoryBudget('8GB', temp_directory='wha_proj_tmp')
+    
     # Connect to duckdb
-    Duckdb= DuckDBConnector(db='wha_proj.db')
+    Duckdb= DuckDBConnector(db='wha_proj.db', budget=budget)
     Duckdb.connect_to_db()
     dckCnx= Duckdb.conn
     
+    # Shared reference database: layers already there are not re-imported
+    ref_path= r'\\spatialfiles.bcgov\Work\lwbc\visr\Workarea\reference\bc_reference.db'
+    ref_db= None
+    if os.path.exists(ref_path):
+        attach_reference_db(dckCnx, ref_path, alias='ref')
+        ref_db= 'ref'
+    
+    # Run journal: completed steps are skipped on rerun
+    journal= RunJournal(dckCnx, run_name='wha_proj')
+    
     print ('\nLoad local datasets')
     gdb= os.path.join(wks,'test.gdb')
     loc_dict={}
-    loc_dict['roads']= os.path.join(gdb, 'integrated_roads_2021')
-    gdbTables= gdf_to_duckdb (dckCnx, loc_dict)
+    loc_dict['roads']= {'path': os.path.join(gdb, 'integrated_roads_2021'),
+                        'columns': ['INTEGRATED_ROADS_ID']}
+    gdbTables= gdf_to_duckdb (dckCnx, loc_dict, journal, ref_db=ref_db, budget=budget)
     
     try:
         print ('\nLoad BCGW datasets') 
         print('..getting watersheds list')
-        wshd_lst= get_wshd_list(orcCnx)
+        # bound as a list, padded to a power of two: the query text (and its parsed
+        # statement) is reused while the number of watersheds stays in the same bucket
+        wshd_ids= get_wshd_list(orcCnx)
         
-        orSql= load_Orc_sql (wshd_lst)
-        orcTables= oracle_2_duckdb (orcCnx, dckCnx, orSql)
+        orSql= load_Orc_sql ()
+        orcTables= oracle_2_duckdb (orcCnx, dckCnx, orSql, journal, 
+                                    bvars={'wshd_ids': wshd_ids}, src_crs='EPSG:3005', 
+                                    ref_db=ref_db, budget=budget)
         
         print ('\nRun duckdb queries')
-        dk_sql= load_dck_sql()
-        results= run_duckdb_queries (dckCnx, dk_sql)
-        
-        #remove duplicates
-        for df in results.values():
-            df.drop_duplicates(inplace= True)
+        #duplicates are removed in duckdb
+        dk_sql= {k: {'sql': v, 'distinct': True} for k, v in load_dck_sql().items()}
+        # results stay in duckdb (rslt_<query>), they are not pulled into pandas
+        results= run_duckdb_queries (dckCnx, dk_sql, journal, lazy=True)
     
     except Exception as e:
         raise Exception(f"Error occurred: {e}")  
@@ -0,0 +1,372 @@
+"""
+Runs an analysis job described in a job spec file (TOML or YAML).
+
+The spec lists the sources to load (Oracle SQL, GDB featureclasses, shapefiles),
+the duckdb queries to run and the exports to produce. Dependencies between steps
+are inferred from the table names referenced in the SQL, and independent steps
+are run concurrently. A query with a `tiled` option is a spatial join run tile by
+tile across processes (see dck_helpers.tiled_join): it runs alone, the other
+steps waiting for it.
+
+Usage:
+    python run_job.py jobs/wdlt.toml [--max-workers 4] [--reset]
+
+--max-workers overrides the max_workers of the spec (default 4).
+"""
+
+import os
+import re
+import timeit
+import argparse
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from dck_helpers import (OracleConnector, DuckDBConnector, AOI, RunJournal, MemoryBudget,
+                         print_event, fan_out, JsonLinesEmitter, PrometheusEmitter,
+                         oracle_2_duckdb, gdf_to_duckdb, run_duckdb_queries, generate_report,
+                         check_same_crs, shape_query, attach_reference_db,
+                         create_layer_crs, join_sql, run_tiled_query)
+
+
+def read_job_spec(spec_file):
+    """Returns the job spec (dict) from a TOML or YAML file"""
+    ext = os.path.splitext(spec_file)[1].lower()
+
+    if ext == '.toml':
+        try:
+            import tomllib
+        except ImportError:
+            import tomli as tomllib
+        with open(spec_file, 'rb') as file:
+            spec = tomllib.load(file)
+
+    elif ext in ('.yaml', '.yml'):
+        import yaml
+        with open(spec_file, 'r') as file:
+            spec = yaml.safe_load(file)
+
+    else:
+        raise Exception('Format not recognized. Please provide a toml or yaml job spec!')
+
+    return spec
+
+
+def read_sql(step, spec_dir):
+    """Returns the SQL of a step, inline (sql) or from a file (sql_file)"""
+    if 'sql' in step:
+        return step['sql']
+
+    with open(os.path.join(spec_dir, step['sql_file']), 'r') as file:
+        return file.read()
+
+
+class JobStep:
+    def __init__(self, name, step_type, params, sql=None, outputs=()):
+        self.name = name
+        self.step_type = step_type
+        self.params = params
+        self.sql = sql
+        self.outputs = set(outputs)
+        self.depends_on = set()
+
+
+def build_steps(spec, spec_dir='.'):
+    """Returns the job steps and infers the dependencies between them"""
+    steps = {}
+
+    for k, v in spec.get('sources', {}).items():
+        if v['type'] == 'oracle':
+            steps[k] = JobStep(k, 'oracle', v, read_sql(v, spec_dir), outputs=[k])
+        elif v['type'] in ('gdb', 'shp'):
+            steps[k] = JobStep(k, 'local', v, outputs=[k])
+        else:
+            raise Exception(f"Source '{k}': type {v['type']} not recognized (oracle, gdb or shp)")
+
+    for k, v in spec.get('queries', {}).items():
+        if k in steps:
+            raise Exception(f"Query '{k}' has the same name as a source")
+        # dedup, grouping and rounding are compiled into the query
+        shaping = {n: x for n, x in v.items() if n in ('distinct', 'distinct_on', 'order_by',
+                                                        'group_by', 'aggregates', 'round_digits')}
+        if 'tiled' in v:
+            # tiled join of two tables: select = select list, tiled = join arguments
+            join = {n: x for n, x in v['tiled'].items()
+                    if n in ('left', 'right', 'left_alias', 'right_alias')}
+            sql = shape_query(join_sql(select=v['select'], **join), **shaping)
+        else:
+            sql = shape_query(read_sql(v, spec_dir), **shaping)
+        steps[k] = JobStep(k, 'query', v, sql, outputs=[f'rslt_{k}'])
+
+    for k, v in spec.get('exports', {}).items():
+        if k in steps:
+            raise Exception(f"Export '{k}' has the same name as a source or query")
+        steps[k] = JobStep(k, 'export', v)
+
+    # a step depends on the steps producing the tables referenced in its SQL
+    producers = {out.lower(): s.name for s in steps.values() for out in s.outputs}
+    for s in steps.values():
+        if s.step_type == 'query':
+            for token in re.findall(r'\b\w+\b', s.sql.lower()):
+                if token in producers and producers[token] != s.name:
+                    s.depends_on.add(producers[token])
+        elif s.step_type == 'export':
+            s.depends_on.update(s.params['queries'])
+
+        s.depends_on.update(s.params.get('depends_on', []))
+
+        for d in s.depends_on:
+            if d not in steps:
+                raise Exception(f"Step '{s.name}' depends on an unknown step: '{d}'")
+
+    check_cycles(steps)
+
+    return steps
+
+
+def check_cycles(steps):
+    """Raises an exception if the dependencies of the steps contain a cycle"""
+    visited = {}
+
+    def visit(name, path):
+        if visited.get(name) == 'done':
+            return
+        if visited.get(name) == 'visiting':
+            raise Exception(f"Cyclic dependency between steps: {' -> '.join(path + [name])}")
+        visited[name] = 'visiting'
+        for d in steps[name].depends_on:
+            visit(d, path + [name])
+        visited[name] = 'done'
+
+    for name in steps:
+        visit(name, [])
+
+
+class JobRunner:
+    def __init__(self, spec, spec_dir='.', max_workers=None):
+        self.spec = spec
+        self.job = spec.get('job', {})
+        self.steps = build_steps(spec, spec_dir)
+        self.shaping = {k: {n: x for n, x in v.items()
+                            if n in ('distinct', 'distinct_on', 'order_by',
+                                     'group_by', 'aggregates', 'round_digits')}
+                        for k, v in spec.get('queries', {}).items()}
+        # the command line wins over the spec
+        self.max_workers = max_workers or self.job.get('max_workers', 4)
+        self.results = {}
+        self.aoi = None
+        self.simplify = {k: v['simplify'] for k, v in spec.get('sources', {}).items()
+                         if 'simplify' in v}
+        self.grid_size = self.job.get('grid_size', 0.01)
+        self.target_crs = self.job.get('target_crs')
+        self.orc_lock = threading.Lock()
+        # concurrent steps share the batch share of the memory budget
+        self.budget = None
+        if 'memory_limit' in self.job:
+            self.budget = MemoryBudget(self.job['memory_limit'], self.job.get('temp_directory'),
+                                       workers=self.max_workers)
+        # progress events: printed, and written as JSON lines / Prometheus metrics
+        self.events = None
+        if 'events_file' in self.job:
+            self.events = JsonLinesEmitter(self.job['events_file'])
+        metrics = None
+        if 'metrics_file' in self.job:
+            metrics = PrometheusEmitter(self.job['metrics_file'],
+                                        labels={'job': self.job.get('name', 'default')})
+        self.emit = fan_out(print_event, self.events, metrics)
+        self.Oracle = None
+        self.Duckdb = None
+
+    def connect(self):
+        """Connects to duckdb, and to Oracle if the job has oracle sources"""
+        self.Duckdb = DuckDBConnector(db=self.job.get('duckdb', ':memory:'), budget=self.budget,
+                                      emit=self.emit)
+        self.Duckdb.connect_to_db()
+
+        # metadata tables are created before the steps run concurrently on their cursors
+        # (concurrent CREATE TABLE IF NOT EXISTS conflict on a new database)
+        RunJournal(self.Duckdb.conn, run_name=self.job.get('name', 'default'))
+        create_layer_crs(self.Duckdb.conn)
+
+        # layers of the shared reference database are queried in place
+        self.ref_db = None
+        self.attach = {}
+        if 'reference_db' in self.job:
+            self.ref_db = 'ref'
+            self.attach = {self.ref_db: self.job['reference_db']}
+            attach_reference_db(self.Duckdb.conn, self.job['reference_db'], self.ref_db)
+
+        if any(s.step_type == 'oracle' for s in self.steps.values()):
+            self.Oracle = OracleConnector(self.job.get('oracle', 'BCGW'))
+            self.Oracle.connect_to_db()
+
+        if 'aoi' in self.job:
+            self.aoi = AOI.from_file(self.job['aoi'], self.job.get('aoi_buffer', 0))
+
+    def disconnect(self):
+        if self.Oracle is not None:
+            self.Oracle.disconnect_db()
+        if self.Duckdb is not None:
+            self.Duckdb.disconnect_db()
+        if self.events is not None:
+            self.events.close()
+
+    def is_tiled(self, step):
+        return step.step_type == 'query' and 'tiled' in step.params
+
+    def oracle_binds(self, step):
+        """Returns the bind variables of an Oracle source and their types: 
+           names of cx_Oracle types (e.g "DB_TYPE_NUMBER") in the spec"""
+        types = step.params.get('types')
+        if types:
+            import cx_Oracle
+            types = {n: getattr(cx_Oracle, t) for n, t in types.items()}
+
+        return step.params.get('binds'), types
+
+    def run_step(self, step):
+        """Runs a single step on its own duckdb cursor"""
+        if self.is_tiled(step):
+            # the duckdb connection is closed while the workers read the file
+            run_tiled_query(self.Duckdb, step.name, step.params['tiled'], step.params['select'],
+                            self.shaping[step.name], self.attach,
+                            self.job.get('name', 'default'), step.depends_on)
+            self.results[step.name] = f'rslt_{step.name}'
+            return
+
+        dckCur = self.Duckdb.conn.cursor()
+        journal = RunJournal(dckCur, run_name=self.job.get('name', 'default'))
+
+        try:
+            if step.step_type == 'oracle':
+                bvars, types = self.oracle_binds(step)
+                # the Oracle connection is shared: one extract at a time
+                with self.orc_lock:
+                    oracle_2_duckdb(self.Oracle.connection, dckCur, {step.name: step.sql},
+                                    journal, bvars=bvars, types=types,
+                                    dtypes=step.params.get('dtypes'),
+                                    simplify=self.simplify, grid_size=self.grid_size,
+                                    src_crs=step.params.get('crs', self.job.get('oracle_crs')),
+                                    target_crs=self.target_crs, aoi=self.aoi,
+                                    ref_db=self.ref_db, budget=self.budget, emit=self.emit)
+
+            elif step.step_type == 'local':
+                # column, bbox and attribute filters are pushed down to the reader
+                read_args = {n: step.params[n] for n in ('path', 'columns', 'where')
+                             if n in step.params}
+                if 'bbox' in step.params:
+                    read_args['bbox'] = tuple(step.params['bbox'])
+                aoi = self.aoi if step.params.get('filter_aoi') else None
+                gdf_to_duckdb(dckCur, {step.name: read_args}, journal,
+                              simplify=self.simplify, grid_size=self.grid_size,
+                              target_crs=self.target_crs, aoi=aoi, ref_db=self.ref_db,
+                              budget=self.budget, emit=self.emit)
+
+            elif step.step_type == 'query':
+                check_same_crs(dckCur, [d for d in step.depends_on
+                                        if self.steps[d].step_type in ('oracle', 'local')])
+                # results stay in duckdb (rslt_<query>) until exported, and are
+                # recomputed only if the steps the query depends on changed
+                run_duckdb_queries(dckCur, {step.name: step.sql}, journal, lazy=True,
+                                   inputs={step.name: step.depends_on})
+                self.results[step.name] = f'rslt_{step.name}'
+
+            elif step.step_type == 'export':
+                self.export(dckCur, step)
+
+        finally:
+            dckCur.close()
+
+    def export(self, dckCur, step):
+        """Exports query results to an excel report or csv files"""
+        params = step.params
+        queries = params['queries']
+        rels = [dckCur.table(self.results[q]) for q in queries]
+        ouloc = params.get('workspace', self.job.get('workspace', '.'))
+        filename = params.get('filename', step.name)
+        if params.get('date_prefix', True):
+            filename = datetime.today().strftime('%Y%m%d') + '_' + filename
+
+        fmt = params.get('format', 'excel')
+        if fmt == 'excel':
+            generate_report(ouloc, rels, queries, filename)
+        elif fmt == 'csv':
+            for q, rel in zip(queries, rels):
+                rel.write_csv(os.path.join(ouloc, f'{filename}_{q}.csv'))
+        else:
+            raise Exception(f"Export '{step.name}': format {fmt} not recognized (excel or csv)")
+
+    def run(self):
+        """Runs the steps, starting each one as soon as its dependencies are completed"""
+        done = set()
+        pending = dict(self.steps)
+        running = {}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while pending or running:
+                ready = [s for s in pending.values() if s.depends_on <= done]
+                # a tiled join runs alone: it waits for the running steps, and blocks the others
+                if any(self.is_tiled(s) for s in running.values()):
+                    ready = []
+                elif any(self.is_tiled(s) for s in ready):
+                    ready = [] if running else [s for s in ready if self.is_tiled(s)][:1]
+                for s in ready:
+                    print(f'..starting {s.step_type} step: {s.name}')
+                    running[executor.submit(self.run_step, s)] = s
+                    del pending[s.name]
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for f in finished:
+                    s = running.pop(f)
+                    try:
+                        f.result()
+                    except Exception:
+                        print(f'..failed {s.step_type} step: {s.name}')
+                        # let the running steps finish (they are journaled for the next run),
+                        # whatever their outcome: the first failure is raised
+                        wait(running)
+                        raise
+                    print(f'..completed {s.step_type} step: {s.name}')
+                    done.add(s.name)
+
+        return self.results
+
+
+def run_job(spec_file, max_workers=None, reset=False):
+    """Runs a job from a spec file and returns the names of 
+       the duckdb tables holding the query results"""
+    spec = read_job_spec(spec_file)
+    runner = JobRunner(spec, os.path.dirname(os.path.abspath(spec_file)), max_workers)
+
+    print('Connect to databases')
+    runner.connect()
+    try:
+        if reset:
+            RunJournal(runner.Duckdb.conn, run_name=runner.job.get('name', 'default')).reset()
+
+        print('\nRun job steps')
+        results = runner.run()
+
+    finally:
+        runner.disconnect()
+
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Run a duckdb analysis job from a job spec')
+    parser.add_argument('spec_file', help='job spec file (toml or yaml)')
+    parser.add_argument('--max-workers', type=int, default=None,
+                        help='max concurrent steps (default: max_workers of the spec, or 4)')
+    parser.add_argument('--reset', action='store_true', help='ignore steps completed by previous runs')
+    args = parser.parse_args()
+
+    start_t = timeit.default_timer() #start time
+
+    run_job(args.spec_file, args.max_workers, args.reset)
+
+    finish_t = timeit.default_timer() #finish time
+    t_sec = round(finish_t-start_t)
+    mins = int (t_sec/60)
+    secs = int (t_sec%60)
+    print (f'\nProcessing Completed in {mins} minutes and {secs} seconds')
@@ -0,0 +1,154 @@
+import pytest
+
+from dck_helpers.extract import (bind_names, bucket_size, expand_binds, geometry_rows_sql,
+                                 OracleExtract)
+
+
+class Connection:
+    """Oracle connection attributes used by OracleExtract"""
+    stmtcachesize = 20
+
+    def __init__(self, description=(), batches=()):
+        self.description = description
+        self.batches = list(batches)
+
+    def cursor(self):
+        return Cursor(self.description, self.batches)
+
+
+class Cursor:
+    """Oracle cursor returning batches of rows"""
+    def __init__(self, description, batches):
+        self.description = description
+        self.batches = list(batches)
+
+    def setinputsizes(self, **sizes):
+        pass
+
+    def execute(self, sql, binds):
+        pass
+
+    def fetchmany(self, rows):
+        return self.batches.pop(0) if self.batches else []
+
+    def close(self):
+        pass
+
+
+def test_bind_names_ignores_literals_and_comments():
+    sql = """SELECT ':not_a_bind', x -- :comment
+             FROM t /* :block */ WHERE a = :a AND b IN (:b) AND TO_CHAR(d, 'HH24:MI') = :c"""
+
+    assert bind_names(sql) == {'a', 'b', 'c'}
+
+
+def test_expand_binds_scalar_and_unreferenced():
+    sql, binds = expand_binds('SELECT * FROM t WHERE a = :a', {'a': 1, 'unused': 2})
+
+    assert sql == 'SELECT * FROM t WHERE a = :a'
+    assert binds == {'a': 1}
+
+
+def test_bucket_size():
+    assert [bucket_size(n) for n in (0, 1, 2, 3, 4, 5, 9, 1000)] == [1, 1, 2, 4, 4, 8, 16, 1024]
+
+
+def test_expand_binds_list():
+    sql, binds = expand_binds('SELECT * FROM t WHERE id IN (:ids) AND x = :ids_x',
+                              {'ids': [10, 20, 30], 'ids_x': 'y'})
+
+    # padded with the last item
+    assert sql == 'SELECT * FROM t WHERE id IN (:ids_0, :ids_1, :ids_2, :ids_3) AND x = :ids_x'
+    assert binds == {'ids_0': 10, 'ids_1': 20, 'ids_2': 30, 'ids_3': 30, 'ids_x': 'y'}
+
+
+def test_expand_binds_list_text_stable_within_bucket():
+    sql = 'SELECT * FROM t WHERE id IN (:ids)'
+
+    assert expand_binds(sql, {'ids': [1, 2, 3]})[0] == expand_binds(sql, {'ids': [4, 5, 6, 7]})[0]
+    assert expand_binds(sql, {'ids': [1, 2, 3]})[0] != expand_binds(sql, {'ids': [1, 2, 3, 4, 5]})[0]
+
+
+def test_expand_binds_geometry_rows():
+    sql, binds = expand_binds('SELECT g.GEOM_ID FROM GEOMETRY_ROWS(:aois) g',
+                              {'aois': [b'wkb0', b'wkb1'], 'srid': 3005})
+
+    assert sql == f"SELECT g.GEOM_ID FROM {geometry_rows_sql('aois', 2)} g"
+    assert binds == {'aois_0': b'wkb0', 'aois_1': b'wkb1', 'srid': 3005}
+
+
+def test_expand_binds_geometry_rows_padded_with_null():
+    sql, binds = expand_binds('SELECT g.GEOM_ID FROM GEOMETRY_ROWS(:aois) g',
+                              {'aois': [b'wkb0', b'wkb1', b'wkb2'], 'srid': 3005})
+
+    assert sql == f"SELECT g.GEOM_ID FROM {geometry_rows_sql('aois', 4)} g"
+    assert 'WHERE :aois_3 IS NOT NULL' in sql
+    assert binds == {'aois_0': b'wkb0', 'aois_1': b'wkb1', 'aois_2': b'wkb2', 'aois_3': None,
+                     'srid': 3005}
+
+
+def test_expand_binds_missing_value():
+    with pytest.raises(Exception, match='without value'):
+        expand_binds('SELECT * FROM t WHERE a = :a AND b = :b', {'a': 1})
+
+
+def test_input_sizes_bytes_as_blob():
+    cx_Oracle = pytest.importorskip('cx_Oracle')
+    extract = OracleExtract(Connection())
+
+    sql, binds = expand_binds('SELECT * FROM t WHERE a = :a AND g = :wkb_aoi',
+                              {'a': 1, 'wkb_aoi': b'wkb'})
+
+    assert extract.input_sizes(binds) == {'wkb_aoi': cx_Oracle.DB_TYPE_BLOB}
+
+
+def test_input_sizes_list_type_applies_to_its_items_only():
+    cx_Oracle = pytest.importorskip('cx_Oracle')
+    extract = OracleExtract(Connection())
+
+    params = {'wkb': [b'a', b'b', b'c'], 'wkb_aoi': b'c', 'code': 'x'}
+    sql, binds = expand_binds('SELECT * FROM t WHERE g IN (:wkb) AND h = :wkb_aoi AND c = :code',
+                              params)
+    sizes = extract.input_sizes(binds, {'wkb': cx_Oracle.DB_TYPE_RAW,
+                                        'code': cx_Oracle.DB_TYPE_CHAR}, params)
+
+    assert sizes == {'wkb_0': cx_Oracle.DB_TYPE_RAW,
+                     'wkb_1': cx_Oracle.DB_TYPE_RAW,
+                     'wkb_2': cx_Oracle.DB_TYPE_RAW,
+                     'wkb_3': cx_Oracle.DB_TYPE_RAW,
+                     'wkb_aoi': cx_Oracle.DB_TYPE_BLOB,
+                     'code': cx_Oracle.DB_TYPE_CHAR}
+
+
+def test_statement_cache_size():
+    cnx = Connection()
+    OracleExtract(cnx, stmtcachesize=50)
+
+    assert cnx.stmtcachesize == 50
+
+
+def test_input_sizes_geometry_rows_padding_as_blob():
+    cx_Oracle = pytest.importorskip('cx_Oracle')
+    extract = OracleExtract(Connection())
+
+    params = {'aois': [b'a', b'b', b'c'], 'srid': 3005}
+    sql, binds = expand_binds('SELECT * FROM GEOMETRY_ROWS(:aois)', params)
+
+    assert extract.input_sizes(binds, params=params) == {f'aois_{i}': cx_Oracle.DB_TYPE_BLOB
+                                                         for i in range(4)}
+
+
+def test_unconstrained_number_integral_then_widened():
+    cx_Oracle = pytest.importorskip('cx_Oracle')
+    description = [('ID', cx_Oracle.NUMBER, 0, 0, 0, -127, True),
+                   ('CODE', cx_Oracle.NUMBER, 0, 0, 0, -127, True),
+                   ('AREA', cx_Oracle.NUMBER, 0, 0, 10, 2, True)]
+    cnx = Connection(description, [[(1, 5, 1.5), (2, None, 2.0)], [(3.5, 6, 1.0)]])
+
+    first, second = OracleExtract(cnx).iter_batches('SELECT * FROM t', dtypes={'CODE': 'Int64'})
+
+    assert list(first.dtypes.astype(str)) == ['Int64', 'Int64', 'float64']
+    assert first['ID'].tolist() == [1, 2]
+    # decimals from the second batch on
+    assert list(second.dtypes.astype(str)) == ['float64', 'Int64', 'float64']
+    assert second['ID'].tolist() == [3.5]
@@ -0,0 +1,122 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+shapely = pytest.importorskip('shapely')
+pa = pytest.importorskip('pyarrow')
+
+from dck_helpers.geometry_store import GeometryStore, POLYGON, MULTIPOLYGON
+
+
+def polygons():
+    return [shapely.box(0, 0, 2, 3),
+            shapely.Polygon([(0, 0), (10, 0), (10, 10), (0, 10)],
+                            [[(1, 1), (2, 1), (2, 2), (1, 2)], [(5, 5), (6, 5), (6, 6)]]),
+            shapely.MultiPolygon([shapely.box(0, 0, 1, 1), shapely.box(5, 5, 7, 8)]),
+            None,
+            shapely.Polygon(),
+            shapely.MultiPolygon(),
+            shapely.Polygon([(0, 0, 1), (4, 0, 1), (4, 4, 2)])]
+
+
+def lines():
+    return [shapely.LineString([(0, 0), (1, 1), (3, 1)]),
+            shapely.MultiLineString([[(0, 0), (1, 1)], [(2, 2), (3, 3), (4, 5)]]),
+            None,
+            shapely.LineString()]
+
+
+def points():
+    return [shapely.Point(3, 4), shapely.MultiPoint([(1, 2), (3, 4)]), None, shapely.Point()]
+
+
+def wkb_array(geoms, **kwargs):
+    return pa.array([None if g is None else shapely.to_wkb(g, **kwargs) for g in geoms])
+
+
+def assert_same_geometries(store, geoms):
+    for got, expected in zip(store.to_shapely(), geoms):
+        if expected is None:
+            assert got is None
+        elif expected.is_empty:
+            assert got.is_empty
+        else:
+            assert shapely.equals(got, shapely.force_2d(expected))
+
+
+# repeated 40 times, the parts and rings are read by the vectorized passes
+@pytest.mark.parametrize('repeat', [1, 40])
+@pytest.mark.parametrize('make', [polygons, lines, points])
+def test_from_wkb_round_trip(make, repeat):
+    geoms = make() * repeat
+    store = GeometryStore.from_wkb(wkb_array(geoms))
+
+    assert len(store) == len(geoms)
+    assert_same_geometries(store, geoms)
+
+
+@pytest.mark.parametrize('kwargs', [{'byte_order': 0}, {'flavor': 'iso'}, {'include_srid': True}])
+def test_from_wkb_flavors(kwargs):
+    geoms = [None if g is None else shapely.set_srid(g, 3005) for g in polygons()]
+    store = GeometryStore.from_wkb(wkb_array(geoms, **kwargs))
+
+    assert_same_geometries(store, geoms)
+
+
+def test_from_wkb_chunked_sliced_and_large():
+    geoms = polygons() + lines()[:1]
+    expected = GeometryStore.from_wkb(wkb_array(geoms))
+
+    chunked = pa.chunked_array([wkb_array(geoms[:3]), wkb_array(geoms[3:])])
+    large = wkb_array(geoms).cast(pa.large_binary())
+    for array in (chunked, large):
+        store = GeometryStore.from_wkb(array)
+        for name in ('coords', 'ring_offsets', 'part_offsets', 'geom_offsets', 'geom_types'):
+            assert np.array_equal(getattr(store, name), getattr(expected, name))
+
+    store = GeometryStore.from_wkb(wkb_array(geoms).slice(1, 3))
+    assert_same_geometries(store, geoms[1:4])
+
+
+def test_from_wkb_many_parts():
+    multi = shapely.MultiPolygon([shapely.box(i, 0, i + 0.5, 1) for i in range(100)])
+    holes = shapely.Polygon([(0, 0), (200, 0), (200, 10), (0, 10)],
+                            [[(i + 0.1, 1), (i + 0.5, 1), (i + 0.5, 2)] for i in range(100)])
+    geoms = [multi, holes] + [shapely.box(0, 0, 1, 1)] * 50
+    store = GeometryStore.from_wkb(wkb_array(geoms))
+
+    assert_same_geometries(store, geoms)
+    assert np.array_equal(store.num_points(), shapely.get_num_coordinates(np.array(geoms)))
+
+
+def test_unsupported_type():
+    collection = shapely.GeometryCollection([shapely.Point(0, 0)])
+
+    with pytest.raises(Exception, match='not supported'):
+        GeometryStore.from_wkb(wkb_array([collection]))
+
+
+def test_area_and_bounds():
+    geoms = polygons()
+    store = GeometryStore.from_wkb(wkb_array(geoms))
+    expected = np.array([0 if g is None else g.area for g in geoms])
+
+    assert np.allclose(store.area(), expected)
+    assert np.allclose(store.bounds(), [[np.nan] * 4 if g is None else g.bounds for g in geoms],
+                       equal_nan=True)
+    assert np.allclose(GeometryStore.from_wkb(wkb_array(lines())).area(), 0)
+
+
+def test_take():
+    geoms = polygons() + polygons()
+    attributes = pa.table({'id': list(range(len(geoms)))})
+    store = GeometryStore.from_wkb(wkb_array(geoms), attributes)
+
+    idx = [8, 1, 3, 5, 2]
+    taken = store.take(idx)
+    assert_same_geometries(taken, [geoms[i] for i in idx])
+    assert taken.attributes.column('id').to_pylist() == idx
+    assert np.allclose(taken.area(), store.area()[idx])
+
+    mask = np.isin(store.geom_types, (POLYGON, MULTIPOLYGON)) & (store.area() > 50)
+    assert np.array_equal(np.flatnonzero(mask), [1, 8])
+    assert len(store.take(mask)) == 2